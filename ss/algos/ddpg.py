@@ -1,9 +1,11 @@
+import os
 from copy import copy, deepcopy
 from functools import reduce
 
 import numpy as np
 import tensorflow as tf
 import tensorflow.contrib as tc
+from mpi4py import MPI
 
 from baselines import logger
 from baselines.common.mpi_adam import MpiAdam
@@ -12,8 +14,11 @@ from baselines.common.mpi_running_mean_std import RunningMeanStd
 from baselines.ddpg.util import reduce_std, mpi_mean
 
 from ss.algos.models import Actor, Critic
+from ss.algos.rollout_workers import Policy
+from ss.envs.reward_utils import check_batched_reward
 from baselines.ddpg.memory import Memory
-from ss.algos.replay_buffer import ReplayBuffer, HERBuffer
+from ss.algos.replay_buffer import ReplayBuffer, HERBuffer, EpisodeHERBuffer
+from ss.algos.sampler import sample_many
 
 from baselines.ddpg.noise import *
 
@@ -25,7 +30,33 @@ class DDPG(object):
             setattr(self, k, params[k])
         self.init_args = copy(params)
 
+        buffer_dir = None
+        if self.buffer_memmap and logger.get_dir():
+            rank = MPI.COMM_WORLD.Get_rank()
+            buffer_dir = os.path.join(logger.get_dir(), 'replay_buffer', str(rank))
+
+        buffer_kwargs = dict(packed=self.buffer_packed,
+            directory=buffer_dir,
+            prioritized=self.prioritized_replay,
+            alpha=self.prioritized_replay_alpha,
+            beta=self.prioritized_replay_beta)
         if self.her:
+            # HER relabels whole batches at once.
+            check_batched_reward(self.reward_fn, np.random.uniform(-0.5, 0.5, (32,) + self.observation_shape))
+
+        if self.her and self.her_strategy != "final":
+            assert not (self.buffer_packed or self.buffer_memmap or self.prioritized_replay), \
+                "EpisodeHERBuffer (her_strategy %s) does not support buffer_packed, buffer_memmap or prioritized_replay" % self.her_strategy
+            self.memory = EpisodeHERBuffer(limit=int(self.buffer_size),
+                action_shape=self.action_shape,
+                observation_shape=self.observation_shape,
+                obs_to_goal=self.obs_to_goal,
+                goal_slice=self.goal_idx,
+                reward_fn=self.reward_fn,
+                episode_length=self.horizon,
+                strategy=self.her_strategy,
+                relabel_ratio=1. - 1. / (1. + self.her_k))
+        elif self.her:
             # self.obs_to_goal = None
             # self.goal_idx = None
             # self.reward_fn = None
@@ -34,7 +65,14 @@ class DDPG(object):
                 observation_shape=self.observation_shape,
                 obs_to_goal=self.obs_to_goal,
                 goal_slice=self.goal_idx,
-                reward_fn=self.reward_fn)
+                reward_fn=self.reward_fn,
+                **buffer_kwargs)
+        elif (self.buffer_packed or buffer_dir or self.prioritized_replay
+              or self.save_buffer or self.restore_buffer):
+            self.memory = ReplayBuffer(limit=int(self.buffer_size),
+                action_shape=self.action_shape,
+                observation_shape=self.observation_shape,
+                **buffer_kwargs)
         else:
             self.memory = Memory(limit=int(self.buffer_size), action_shape=self.action_shape, observation_shape=self.observation_shape)
 
@@ -50,7 +88,7 @@ class DDPG(object):
         # self.terminals1 = tf.placeholder(tf.float32, shape=(None, 1), name='terminals1')
         self.rewards = tf.placeholder(tf.float32, shape=(None, 1), name='rewards')
         self.actions = tf.placeholder(tf.float32, shape=(None,) + self.action_shape, name='actions')
-        self.critic_target = tf.placeholder(tf.float32, shape=(None, 1), name='critic_target')
+        self.importance_weights = tf.placeholder_with_default(tf.ones([tf.shape(self.obs0)[0], 1]), shape=(None, 1), name='importance_weights')
         self.param_noise_stddev = tf.placeholder(tf.float32, shape=(), name='param_noise_stddev')
 
         # Observation normalization.
@@ -59,10 +97,9 @@ class DDPG(object):
                 self.obs_rms = RunningMeanStd(shape=self.observation_shape)
         else:
             self.obs_rms = None
-        normalized_obs0 = tf.clip_by_value(normalize(self.obs0, self.obs_rms),
-            self.observation_range[0], self.observation_range[1])
-        normalized_obs1 = tf.clip_by_value(normalize(self.obs1, self.obs_rms),
-            self.observation_range[0], self.observation_range[1])
+        self.reset_obs_stats()
+        normalized_obs0 = self.normalize_obs(self.obs0)
+        normalized_obs1 = self.normalize_obs(self.obs1)
 
         # Return normalization.
         if self.normalize_returns:
@@ -85,25 +122,66 @@ class DDPG(object):
         self.critic_tf = denormalize(tf.clip_by_value(self.normalized_critic_tf, self.return_range[0], self.return_range[1]), self.ret_rms)
         self.normalized_critic_with_actor_tf = self.critic(normalized_obs0, self.actor_tf, reuse=True)
         self.critic_with_actor_tf = denormalize(tf.clip_by_value(self.normalized_critic_with_actor_tf, self.return_range[0], self.return_range[1]), self.ret_rms)
-        Q_obs1 = denormalize(target_critic(normalized_obs1, target_actor(normalized_obs1)), self.ret_rms)
-        # self.target_Q = self.rewards + (1. - self.terminals1) * self.gamma * Q_obs1
-        self.target_Q = self.rewards + self.gamma * Q_obs1
-
-        # Set up parts.
+        self.target_Q = self.get_target_Q(normalized_obs1, self.rewards)
+        # Fed with precomputed targets by the MpiAdam path; the fused train op
+        # computes them in the same run from obs1 and rewards.
+        self.critic_target = tf.placeholder_with_default(tf.stop_gradient(self.target_Q), shape=(None, 1), name='critic_target')
+
+        # A single process applies updates in-graph, in one sess.run per step.
+        # Pop-art has to update ret_rms between computing targets and training.
+        self.fused_train = (self.fused_train and MPI.COMM_WORLD.Get_size() == 1
+            and not (self.normalize_returns and self.enable_popart))
+
+        # Set up parts. Target updates come first: in-graph Adam adds slot
+        # variables under the actor and critic scopes.
+        self.setup_target_network_updates()
         if self.param_noise is not None:
             self.setup_param_noise(normalized_obs0)
         self.setup_actor_optimizer()
         self.setup_critic_optimizer()
+        if self.fused_train:
+            self.setup_fused_train()
+        self.train_loop_in_graph = self.train_loop_in_graph and self.fused_train
+        if self.train_loop_in_graph:
+            self.setup_train_loop()
         if self.normalize_returns and self.enable_popart:
             self.setup_popart()
         self.setup_stats()
-        self.setup_target_network_updates()
+
+    def normalize_obs(self, obs):
+        return tf.clip_by_value(normalize(obs, self.obs_rms),
+            self.observation_range[0], self.observation_range[1])
+
+    def get_target_Q(self, normalized_obs1, rewards, reuse=False):
+        Q_obs1 = denormalize(self.target_critic(normalized_obs1, self.target_actor(normalized_obs1, reuse=reuse), reuse=reuse), self.ret_rms)
+        # return rewards + (1. - self.terminals1) * self.gamma * Q_obs1
+        return rewards + self.gamma * Q_obs1
+
+    def get_critic_loss(self, normalized_critic_tf, critic_target, importance_weights):
+        normalized_critic_target_tf = tf.clip_by_value(normalize(critic_target, self.ret_rms), self.return_range[0], self.return_range[1])
+        critic_loss = tf.reduce_mean(importance_weights * tf.square(normalized_critic_tf - normalized_critic_target_tf))
+        if self.critic_l2_reg > 0.:
+            critic_reg_vars = [var for var in self.critic.trainable_vars if 'kernel' in var.name and 'output' not in var.name]
+            critic_reg = tc.layers.apply_regularization(
+                tc.layers.l2_regularizer(self.critic_l2_reg),
+                weights_list=critic_reg_vars
+            )
+            critic_loss += critic_reg
+        return critic_loss
 
     def setup_target_network_updates(self):
-        actor_init_updates, actor_soft_updates = get_target_updates(self.actor.vars, self.target_actor.vars, self.tau)
-        critic_init_updates, critic_soft_updates = get_target_updates(self.critic.vars, self.target_critic.vars, self.tau)
-        self.target_init_updates = [actor_init_updates, critic_init_updates]
-        self.target_soft_updates = [actor_soft_updates, critic_soft_updates]
+        self.target_update_vars = (self.actor.vars + self.critic.vars,
+            self.target_actor.vars + self.target_critic.vars)
+        self.target_init_updates, self.target_soft_updates = get_target_updates(*self.target_update_vars, tau=self.tau)
+
+    def get_step_target_update(self, update):
+        """update followed by a soft target update, for target_update_freq
+        "step" (a new op, so it can also be built inside the train loop)
+        """
+        if self.target_update_freq != "step":
+            return update
+        with tf.control_dependencies([update]):
+            return get_soft_target_updates(*self.target_update_vars, tau=self.tau)
 
     def setup_actor_optimizer(self):
         logger.info('setting up actor optimizer')
@@ -112,32 +190,100 @@ class DDPG(object):
         actor_nb_params = sum([reduce(lambda x, y: x * y, shape) for shape in actor_shapes])
         logger.info('  actor shapes: {}'.format(actor_shapes))
         logger.info('  actor params: {}'.format(actor_nb_params))
+        if self.fused_train:
+            self.actor_optimizer = tf.train.AdamOptimizer(learning_rate=self.actor_lr,
+                beta1=0.9, beta2=0.999, epsilon=1e-08)
+            return
         self.actor_grads = U.flatgrad(self.actor_loss, self.actor.trainable_vars, clip_norm=self.clip_norm)
         self.actor_optimizer = MpiAdam(var_list=self.actor.trainable_vars,
             beta1=0.9, beta2=0.999, epsilon=1e-08)
 
     def setup_critic_optimizer(self):
         logger.info('setting up critic optimizer')
-        normalized_critic_target_tf = tf.clip_by_value(normalize(self.critic_target, self.ret_rms), self.return_range[0], self.return_range[1])
-        self.critic_loss = tf.reduce_mean(tf.square(self.normalized_critic_tf - normalized_critic_target_tf))
+        self.critic_loss = self.get_critic_loss(self.normalized_critic_tf, self.critic_target, self.importance_weights)
         if self.critic_l2_reg > 0.:
             critic_reg_vars = [var for var in self.critic.trainable_vars if 'kernel' in var.name and 'output' not in var.name]
             for var in critic_reg_vars:
                 logger.info('  regularizing: {}'.format(var.name))
             logger.info('  applying l2 regularization with {}'.format(self.critic_l2_reg))
-            critic_reg = tc.layers.apply_regularization(
-                tc.layers.l2_regularizer(self.critic_l2_reg),
-                weights_list=critic_reg_vars
-            )
-            self.critic_loss += critic_reg
         critic_shapes = [var.get_shape().as_list() for var in self.critic.trainable_vars]
         critic_nb_params = sum([reduce(lambda x, y: x * y, shape) for shape in critic_shapes])
         logger.info('  critic shapes: {}'.format(critic_shapes))
         logger.info('  critic params: {}'.format(critic_nb_params))
+        if self.fused_train:
+            self.critic_optimizer = tf.train.AdamOptimizer(learning_rate=self.critic_lr,
+                beta1=0.9, beta2=0.999, epsilon=1e-08)
+            return
         self.critic_grads = U.flatgrad(self.critic_loss, self.critic.trainable_vars, clip_norm=self.clip_norm)
         self.critic_optimizer = MpiAdam(var_list=self.critic.trainable_vars,
             beta1=0.9, beta2=0.999, epsilon=1e-08)
 
+    def setup_fused_train(self):
+        """One op that computes critic targets and both losses from obs0,
+        actions, rewards and obs1 and applies Adam to actor and critic.
+        Like the MpiAdam path, both gradients (and the fetched losses and Q)
+        are computed before either network changes.
+        """
+        logger.info('setting up fused train op')
+        self.train_op = self.get_step_target_update(self.get_fused_update(self.actor_loss, self.critic_loss,
+            [self.critic_tf, self.critic_target]))
+
+    def get_fused_update(self, actor_loss, critic_loss, reads):
+        """Adam updates of actor and critic that only run once both gradients,
+        both losses and the tensors in reads have been computed
+        """
+        actor_grads = tf.gradients(actor_loss, self.actor.trainable_vars)
+        critic_grads = tf.gradients(critic_loss, self.critic.trainable_vars)
+        if self.clip_norm is not None:
+            actor_grads = [tf.clip_by_norm(g, clip_norm=self.clip_norm) for g in actor_grads]
+            critic_grads = [tf.clip_by_norm(g, clip_norm=self.clip_norm) for g in critic_grads]
+        with tf.control_dependencies(actor_grads + critic_grads + [actor_loss, critic_loss] + reads):
+            return tf.group(
+                self.actor_optimizer.apply_gradients(list(zip(actor_grads, self.actor.trainable_vars))),
+                self.critic_optimizer.apply_gradients(list(zip(critic_grads, self.critic.trainable_vars))))
+
+    def setup_train_loop(self):
+        """A tf.while_loop that runs one fused train step per batch of a
+        (K, batch_size, ...) stack, feeding each batch through the networks
+        in turn. Adam's slots already exist (setup_fused_train), so nothing
+        is created inside the loop. Per-step losses and TD errors come back
+        as arrays.
+        """
+        logger.info('setting up in-graph train loop')
+        self.loop_obs0 = tf.placeholder(tf.float32, shape=(None, None) + self.observation_shape, name='loop_obs0')
+        self.loop_obs1 = tf.placeholder(tf.float32, shape=(None, None) + self.observation_shape, name='loop_obs1')
+        self.loop_rewards = tf.placeholder(tf.float32, shape=(None, None, 1), name='loop_rewards')
+        self.loop_actions = tf.placeholder(tf.float32, shape=(None, None) + self.action_shape, name='loop_actions')
+        self.loop_weights = tf.placeholder_with_default(tf.ones_like(self.loop_rewards), shape=(None, None, 1), name='loop_weights')
+        nb_steps = tf.shape(self.loop_obs0)[0]
+
+        def body(i, actor_losses, critic_losses, td_errors):
+            normalized_obs0 = self.normalize_obs(self.loop_obs0[i])
+            normalized_obs1 = self.normalize_obs(self.loop_obs1[i])
+            actor_tf = self.actor(normalized_obs0, reuse=True)
+            normalized_critic_tf = self.critic(normalized_obs0, self.loop_actions[i], reuse=True)
+            critic_tf = denormalize(tf.clip_by_value(normalized_critic_tf, self.return_range[0], self.return_range[1]), self.ret_rms)
+            normalized_critic_with_actor_tf = self.critic(normalized_obs0, actor_tf, reuse=True)
+            critic_with_actor_tf = denormalize(tf.clip_by_value(normalized_critic_with_actor_tf, self.return_range[0], self.return_range[1]), self.ret_rms)
+            target_Q = tf.stop_gradient(self.get_target_Q(normalized_obs1, self.loop_rewards[i], reuse=True))
+
+            actor_loss = -tf.reduce_mean(critic_with_actor_tf)
+            critic_loss = self.get_critic_loss(normalized_critic_tf, target_Q, self.loop_weights[i])
+            td_error = target_Q - critic_tf
+            update = self.get_step_target_update(self.get_fused_update(actor_loss, critic_loss, [td_error]))
+            with tf.control_dependencies([update]):
+                return (i + 1, actor_losses.write(i, actor_loss),
+                    critic_losses.write(i, critic_loss), td_errors.write(i, td_error))
+
+        loop_vars = (tf.constant(0), tf.TensorArray(tf.float32, size=nb_steps),
+            tf.TensorArray(tf.float32, size=nb_steps), tf.TensorArray(tf.float32, size=nb_steps))
+        # parallel_iterations=1: each step must see the previous step's weights
+        _, actor_losses, critic_losses, td_errors = tf.while_loop(lambda i, *_: i < nb_steps, body, loop_vars,
+            parallel_iterations=1, back_prop=False)
+        self.loop_actor_losses = actor_losses.stack()
+        self.loop_critic_losses = critic_losses.stack()
+        self.loop_td_errors = td_errors.stack()
+
     def setup_popart(self):
         # See https://arxiv.org/pdf/1602.07714.pdf for details.
         self.old_std = tf.placeholder(tf.float32, shape=[1], name='old_std')
@@ -211,15 +357,78 @@ class DDPG(object):
         action = np.clip(action, self.action_range[0], self.action_range[1])
         return action, q
 
+    def pi_batch(self, obs, apply_noise=True, compute_Q=True):
+        """Actions (and Q values) for an (N, obs_dim) batch of observations in
+        one sess.run, with independent Gaussian noise drawn for every row.
+        Returns (N, action_dim) actions and (N, 1) Q values or None.
+        """
+        if self.param_noise is not None and apply_noise:
+            actor_tf = self.perturbed_actor_tf
+        else:
+            actor_tf = self.actor_tf
+        feed_dict = {self.obs0: obs}
+        if compute_Q:
+            actions, q = self.sess.run([actor_tf, self.critic_with_actor_tf], feed_dict=feed_dict)
+        else:
+            actions = self.sess.run(actor_tf, feed_dict=feed_dict)
+            q = None
+        if self.action_noise is not None and apply_noise:
+            actions += np.random.normal(self.action_noise.mu, self.action_noise.sigma, size=actions.shape)
+        actions = np.clip(actions, self.action_range[0], self.action_range[1])
+        return actions, q
+
+    def get_actor_policy(self):
+        """Snapshot of the actor and observation normalization for the NumPy
+        policy of rollout workers
+        """
+        names = [var.name[len(self.actor.name) + 1:].split(':')[0] for var in self.actor.trainable_vars]
+        values = self.sess.run(self.actor.trainable_vars)
+        obs_mean, obs_std = None, None
+        if self.normalize_observations:
+            obs_mean, obs_std = self.sess.run([self.obs_rms.mean, self.obs_rms.std])
+        return Policy(dict(zip(names, values)), obs_mean, obs_std,
+            self.observation_range, self.action_range, float(self.noise_sigma), self.layer_norm)
+
+    def q_batch(self, obs):
+        """Q of the (noise-free) actor's actions for a batch of observations"""
+        return self.sess.run(self.critic_with_actor_tf, feed_dict={self.obs0: obs})
+
     def store_transition(self, obs0, action, reward, obs1, terminal1):
         reward *= self.reward_scale
         self.memory.append(obs0, action, reward, obs1, terminal1)
         if self.normalize_observations:
-            self.obs_rms.update(np.array([obs0]))
-
-    def train(self):
-        # Get a batch.
-        batch = self.memory.sample(batch_size=self.batch_size)
+            # added to obs_rms in batches by update_obs_rms
+            self.obs_sum += obs0
+            self.obs_sumsq += np.square(obs0)
+            self.obs_count += 1
+
+    def reset_obs_stats(self):
+        self.obs_sum = np.zeros(self.observation_shape, dtype='float64')
+        self.obs_sumsq = np.zeros(self.observation_shape, dtype='float64')
+        self.obs_count = 0
+
+    def update_obs_rms(self):
+        """Adds the observations stored since the last call to obs_rms, with
+        one allreduce and one assignment (what RunningMeanStd.update does for
+        a batch). Collective: every rank has to call it at the same points.
+        """
+        if not self.normalize_observations:
+            return
+        n = self.obs_sum.size
+        local = np.concatenate([self.obs_sum.ravel(), self.obs_sumsq.ravel(), [self.obs_count]])
+        total = np.zeros_like(local)
+        MPI.COMM_WORLD.Allreduce(local, total, op=MPI.SUM)
+        self.obs_rms.incfiltparams(total[:n].reshape(self.observation_shape),
+            total[n:2 * n].reshape(self.observation_shape), total[2 * n])
+        self.reset_obs_stats()
+
+    def train(self, batch=None):
+        # Get a batch, unless one was prefetched.
+        if batch is None:
+            batch = self.memory.sample(batch_size=self.batch_size)
+
+        if self.fused_train:
+            return self.train_fused(batch)
 
         if self.normalize_returns and self.enable_popart:
             old_mean, old_std, target_Q = self.sess.run([self.ret_rms.mean, self.ret_rms.std, self.target_Q], feed_dict={
@@ -250,22 +459,80 @@ class DDPG(object):
             })
 
         # Get all gradients and perform a synced update.
-        ops = [self.actor_grads, self.actor_loss, self.critic_grads, self.critic_loss]
-        actor_grads, actor_loss, critic_grads, critic_loss = self.sess.run(ops, feed_dict={
+        ops = [self.actor_grads, self.actor_loss, self.critic_grads, self.critic_loss, self.critic_tf]
+        feed_dict = {
             self.obs0: batch['obs0'],
             self.actions: batch['actions'],
             self.critic_target: target_Q,
-        })
+        }
+        if 'weights' in batch:
+            feed_dict[self.importance_weights] = batch['weights']
+        actor_grads, actor_loss, critic_grads, critic_loss, Q = self.sess.run(ops, feed_dict=feed_dict)
         self.actor_optimizer.update(actor_grads, stepsize=self.actor_lr)
         self.critic_optimizer.update(critic_grads, stepsize=self.critic_lr)
+        if self.target_update_freq == "step":
+            self.update_target_net()
+
+        if 'idxs' in batch:
+            self.memory.update_priorities(batch['idxs'], target_Q - Q)
+
+        return critic_loss, actor_loss
+
+    def train_fused(self, batch):
+        """train() as a single sess.run of train_op"""
+        ops = [self.train_op, self.actor_loss, self.critic_loss, self.critic_tf, self.critic_target]
+        feed_dict = {
+            self.obs0: batch['obs0'],
+            self.actions: batch['actions'],
+            self.rewards: batch['rewards'],
+            self.obs1: batch['obs1'],
+        }
+        if 'weights' in batch:
+            feed_dict[self.importance_weights] = batch['weights']
+        _, actor_loss, critic_loss, Q, target_Q = self.sess.run(ops, feed_dict=feed_dict)
+
+        if 'idxs' in batch:
+            self.memory.update_priorities(batch['idxs'], target_Q - Q)
 
         return critic_loss, actor_loss
 
+    def train_loop(self, nb_steps):
+        """nb_steps fused train steps in one sess.run of the in-graph loop, on
+        batches drawn with one sample_many call (strided, so every batch is
+        spread over the whole buffer). Returns arrays of the per-step critic
+        and actor losses.
+        """
+        batches = sample_many(self.memory, nb_steps, self.batch_size)
+        stack = lambda key: np.stack([b[key] for b in batches])
+        feed_dict = {
+            self.loop_obs0: stack('obs0'),
+            self.loop_actions: stack('actions'),
+            self.loop_rewards: stack('rewards'),
+            self.loop_obs1: stack('obs1'),
+        }
+        if 'weights' in batches[0]:
+            feed_dict[self.loop_weights] = stack('weights')
+        critic_losses, actor_losses, td_errors = self.sess.run(
+            [self.loop_critic_losses, self.loop_actor_losses, self.loop_td_errors], feed_dict=feed_dict)
+
+        if 'idxs' in batches[0]:
+            # td_errors is (nb_steps, batch_size, 1), in the order of batches
+            self.memory.update_priorities(np.concatenate([b['idxs'] for b in batches]), np.reshape(td_errors, (-1, 1)))
+
+        return critic_losses, actor_losses
+
+    def sync_optimizers(self):
+        """Broadcast rank 0's parameters (MpiAdam only; in-graph Adam is
+        used in a single process)
+        """
+        if not self.fused_train:
+            self.actor_optimizer.sync()
+            self.critic_optimizer.sync()
+
     def initialize(self, sess):
         self.sess = sess
         self.sess.run(tf.global_variables_initializer())
-        self.actor_optimizer.sync()
-        self.critic_optimizer.sync()
+        self.sync_optimizers()
         self.sess.run(self.target_init_updates)
 
     def update_target_net(self):
@@ -317,10 +584,14 @@ class DDPG(object):
                 self.param_noise_stddev: self.param_noise.current_stddev,
             })
         self.flush()
+        if self.obs_rms_update_freq == "episode":
+            self.update_obs_rms()
 
     def flush(self):
         if self.her:
             self.memory.flush()
+        elif isinstance(self.memory, ReplayBuffer):
+            self.memory.sync()
 
     def get_save_tf(self):
         all_variables = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES)
@@ -342,13 +613,15 @@ class DDPG(object):
         return {'tf': self.get_save_tf(), 'init': args}
 
     def __setstate__(self, state):
-        self.__init__(**state['init'])
+        # params.py imports the MuJoCo envs, so only load it when unpickling
+        from ss.algos.params import get_params
+        # agents pickled before a param existed get its default
+        self.__init__(**get_params(**state['init']))
 
         self.sess = tf.InteractiveSession() # for now just make ourself a session
         self.sess.run(tf.global_variables_initializer())
         self.restore_tf(state['tf'])
-        self.actor_optimizer.sync()
-        self.critic_optimizer.sync()
+        self.sync_optimizers()
 
 def normalize(x, stats):
     if stats is None:
@@ -362,16 +635,27 @@ def denormalize(x, stats):
 
 def get_target_updates(vars, target_vars, tau):
     logger.info('setting up target updates ...')
-    soft_updates = []
     init_updates = []
     assert len(vars) == len(target_vars)
     for var, target_var in zip(vars, target_vars):
         logger.info('  {} <- {}'.format(target_var.name, var.name))
         init_updates.append(tf.assign(target_var, var))
-        soft_updates.append(tf.assign(target_var, (1. - tau) * target_var + tau * var))
     assert len(init_updates) == len(vars)
-    assert len(soft_updates) == len(vars)
-    return tf.group(*init_updates), tf.group(*soft_updates)
+    return tf.group(*init_updates), get_soft_target_updates(vars, target_vars, tau)
+
+def get_soft_target_updates(vars, target_vars, tau):
+    """Polyak averaging of all (var, target_var) pairs computed once on the
+    concatenation of all variables, then split back into the targets
+    """
+    if tau == 1.:
+        return tf.group(*[tf.assign(target_var, var) for var, target_var in zip(vars, target_vars)])
+    flat = tf.concat([tf.reshape(var, [-1]) for var in vars], axis=0)
+    target_flat = tf.concat([tf.reshape(var, [-1]) for var in target_vars], axis=0)
+    new_flat = (1. - tau) * target_flat + tau * flat
+    sizes = [int(np.prod(var.get_shape().as_list())) for var in target_vars]
+    updates = [tf.assign(target_var, tf.reshape(x, target_var.get_shape()))
+        for target_var, x in zip(target_vars, tf.split(new_flat, sizes))]
+    return tf.group(*updates)
 
 def get_perturbed_actor_updates(actor, perturbed_actor, param_noise_stddev):
     assert len(actor.vars) == len(perturbed_actor.vars)
@@ -12,6 +12,7 @@ from baselines.common.misc_util import (
 
 from ss.algos.trainer import Trainer
 from ss.algos.params import get_params
+from ss.envs.vec_env import VecMujocoEnv
 
 from baselines.ddpg.noise import *
 from ss.path import get_expdir
@@ -65,7 +66,13 @@ def run(params):
         logger.configure(logdir, ['stdout', 'log', 'json', 'tensorboard'])
 
     # Create envs.
-    env = params["env_type"]()
+    if params["nb_envs"] > 1 and hasattr(params["env_type"], "vec_env_type"):
+        # envs with their own vectorized implementation, e.g. FastBallEnv
+        env = params["env_type"].vec_env_type(params["nb_envs"], params["horizon"], **params["env_kwargs"])
+    elif params["nb_envs"] > 1:
+        env = VecMujocoEnv(params["env_type"], params["nb_envs"], params["horizon"], **params["env_kwargs"])
+    else:
+        env = params["env_type"](**params["env_kwargs"])
     params["observation_shape"] = env.observation_space.shape
     params["action_shape"] = env.action_space.shape
     params["obs_to_goal"] = env.obs_to_goal
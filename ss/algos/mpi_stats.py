@@ -0,0 +1,56 @@
+"""Epoch statistics reduced across MPI ranks in a single Allreduce"""
+
+import numpy as np
+from mpi4py import MPI
+
+class MpiStats(object):
+    """Collects values under keys, then reduces all of them in one Allreduce
+    of a packed (keys, 3) array of sums, sums of squares and counts.
+    mean/std/sum give the same results as baselines.ddpg.util's mpi_mean,
+    mpi_std and mpi_sum (including their conventions: [] counts as [0.] and
+    only the first column of 2-D values, e.g. a list of actions, is used).
+    """
+    def __init__(self):
+        self.keys = []
+        self.kinds = []
+        self.rows = []
+
+    def add(self, key, kind, row):
+        self.keys.append(key)
+        self.kinds.append(kind)
+        self.rows.append(row)
+
+    def moments(self, value):
+        if isinstance(value, list) and len(value) == 0:
+            value = [0.]
+        if not isinstance(value, list):
+            value = [value]
+        x = np.array(value, dtype='float64')
+        x = x.reshape(len(x), -1)[:, 0]
+        return [x.sum(), np.square(x).sum(), len(x)]
+
+    def mean(self, key, value):
+        self.add(key, 'mean', self.moments(value))
+
+    def std(self, key, value):
+        self.add(key, 'std', self.moments(value))
+
+    def sum(self, key, value):
+        self.add(key, 'sum', [np.sum(np.array(value)), 0., 0.])
+
+    def reduce(self):
+        """dict of key -> statistic over all ranks"""
+        local = np.array(self.rows, dtype='float64').reshape(-1, 3)
+        total = np.zeros_like(local)
+        MPI.COMM_WORLD.Allreduce(local, total, op=MPI.SUM)
+        results = {}
+        for key, kind, (s, sumsq, count) in zip(self.keys, self.kinds, total):
+            if kind == 'sum':
+                results[key] = s
+                continue
+            mean = s / count
+            if kind == 'mean':
+                results[key] = mean
+            else:
+                results[key] = np.sqrt(max(sumsq / count - mean ** 2, 0.))
+        return results
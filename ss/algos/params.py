@@ -10,6 +10,7 @@ def get_params(**kwargs):
     params["expname"] = None
     params["gamma"] = 0.95
     params["tau"] = 1.0
+    params["target_update_freq"] = "epoch" # soft target update every "step", "cycle" or "epoch"
     params["batch_size"] = 128
     params["observation_range"] = (-5., 5.)
     params["action_range"] = (-1., 1.)
@@ -21,23 +22,54 @@ def get_params(**kwargs):
     params["nb_epochs"] = 5000
     params["nb_epoch_cycles"] = 20
     params["nb_train_steps"] = 50  # per epoch cycle and MPI worker
+    params["prefetch_batches"] = 0 # >0: draw batches on a background thread, this many per chunk
     params["render"] = False
     params["her"] = False
+    params["her_strategy"] = "final" # final keeps the flush-time HERBuffer; future, episode, random relabel at sample time
+    params["her_k"] = 4 # relabeled samples per original for sample-time strategies
     params["buffer_size"] = 1000000
+    params["buffer_packed"] = False # one contiguous float32 row per transition
+    params["buffer_memmap"] = False # back the buffer with np.memmap files under the logdir
+    params["save_buffer"] = False # snapshot the replay buffer along with the agent pickle
+    params["save_buffer_compress"] = False
+    params["restore_buffer"] = None # path of a snapshot to start from
+    params["prioritized_replay"] = False
+    params["prioritized_replay_alpha"] = 0.6
+    params["prioritized_replay_beta"] = 0.4
     params["noise_mu"] = 0.0
     params["noise_sigma"] = 0.1
     params["reward_scale"] = 1.0
     params["horizon"] = 20
+    params["nb_envs"] = 1 # >1 collects with a VecMujocoEnv and batched policy calls
+    params["nb_rollout_workers"] = 0 # >0 collects in worker processes with a NumPy actor
+    params["worker_episodes"] = 1 # episodes per worker per cycle
+    params["async_collect"] = False # workers collect continuously instead of alternating with training (single MPI process only)
+    params["update_to_data_ratio"] = None # async: train steps per env step, default nb_train_steps / horizon
+    params["weight_sync_freq"] = None # async: train steps between actor syncs, default nb_train_steps
+    params["q_sample_freq"] = 1 # critic eval for rollout/Q_mean every N steps; 0: once per epoch, batched
     params["stats_sample"] = None
+    params["stats_freq"] = 1 # agent stats (get_stats, epoch Q estimate) every N epochs; 0 disables them
     params["layer_norm"] = True
     params["normalize_returns"] = False
     params["normalize_observations"] = True
+    params["obs_rms_update_freq"] = "episode" # add stored observations to obs_rms once per "episode" or "cycle"
     params["popart"] = False
     params["clip_norm"] = None
+    params["fused_train"] = True # single MPI process: one sess.run per train step with in-graph Adam
+    params["train_loop_in_graph"] = False # with fused_train: each cycle's nb_train_steps steps in one tf.while_loop
     params["her"] = False
     params["env_type"] = BallEnv
+    params["env_kwargs"] = {} # e.g. reset_cache="boxenv_resets.npz" for BoxEnv
+    params["frame_skip"] = 1 # physics steps per agent step, action held on each (BallEnv, BoxEnv)
 
     for key in kwargs:
         params[key] = kwargs[key]
 
+    if params["update_to_data_ratio"] is None:
+        params["update_to_data_ratio"] = params["nb_train_steps"] / params["horizon"]
+    if params["weight_sync_freq"] is None:
+        params["weight_sync_freq"] = params["nb_train_steps"]
+    if params["frame_skip"] != 1:
+        params["env_kwargs"] = dict(params["env_kwargs"], frame_skip=params["frame_skip"])
+
     return params
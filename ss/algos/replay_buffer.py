@@ -1,14 +1,78 @@
 """Replay buffer adapted from OpenAI Baselines"""
 
+import os
+import json
+import shutil
+import threading
 import numpy as np
 import pdb
 
+from ss.algos.sum_tree import SumTree, MinTree
+
+def open_memmap(filename, shape, dtype):
+    """Reopen the .npy file if it already holds an array of this shape and
+    dtype (so a run can resume), otherwise create it
+    """
+    if os.path.exists(filename):
+        data = np.lib.format.open_memmap(filename, mode='r+')
+        if data.shape == shape and data.dtype == np.dtype(dtype):
+            return data
+        del data
+    return np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+
+def save_rings(path, header, rings, compress=False):
+    """Write the filled region of each ring (oldest row first) plus a small
+    json header to directory path. compress=True writes one rings.npz with
+    np.savez_compressed instead of one raw .npy per ring. The snapshot is
+    written next to path and moved into place when complete.
+    """
+    tmp_path = path.rstrip('/') + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    if compress:
+        np.savez_compressed(os.path.join(tmp_path, 'rings.npz'),
+            **{name: ring.ordered() for name, ring in rings.items()})
+    else:
+        for name, ring in rings.items():
+            ring.save(os.path.join(tmp_path, name + '.npy'))
+    header = dict(header, compressed=compress)
+    with open(os.path.join(tmp_path, 'header.json'), 'w') as f:
+        json.dump(header, f)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+def load_rings(path, header, rings):
+    """Refill rings from a snapshot written by save_rings. Raw .npy arrays
+    are memory-mapped and copied in directly.
+    """
+    with open(os.path.join(path, 'header.json'), 'r') as f:
+        saved = json.load(f)
+    layout = {k: saved.get(k) for k in header}
+    if layout != header:
+        raise ValueError("replay buffer snapshot %s has layout %s, expected %s" % (path, layout, header))
+    if saved['compressed']:
+        arrays = np.load(os.path.join(path, 'rings.npz'))
+    else:
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in rings}
+    for name, ring in rings.items():
+        ring.start = 0
+        ring.length = 0
+        ring.extend(arrays[name])
+
 class RingBuffer(object):
-    def __init__(self, maxlen, shape, dtype='float32'):
+    def __init__(self, maxlen, shape, dtype='float32', filename=None):
+        """If filename is given the ring is backed by a memory-mapped .npy
+        file and the OS pages rows in and out as needed
+        """
         self.maxlen = maxlen
         self.start = 0
         self.length = 0
-        self.data = np.zeros((maxlen,) + shape).astype(dtype)
+        if filename is None:
+            self.data = np.zeros((maxlen,) + shape, dtype=dtype)
+        else:
+            self.data = open_memmap(filename, (maxlen,) + shape, dtype)
 
     def __len__(self):
         return self.length
@@ -22,6 +86,31 @@ class RingBuffer(object):
         return self.data[(self.start + idxs) % self.maxlen]
 
     def append(self, v):
+        self.data[self.advance()] = v
+
+    def parts(self):
+        """The filled region in order, as at most two contiguous views"""
+        end = self.start + self.length
+        if end <= self.maxlen:
+            return [self.data[self.start:end]]
+        return [self.data[self.start:], self.data[:end - self.maxlen]]
+
+    def ordered(self):
+        return np.concatenate(self.parts())
+
+    def save(self, filename):
+        """Write the filled region, oldest row first, as a .npy file"""
+        out = np.lib.format.open_memmap(filename, mode='w+', dtype=self.data.dtype,
+            shape=(self.length,) + self.data.shape[1:])
+        i = 0
+        for part in self.parts():
+            out[i:i + len(part)] = part
+            i += len(part)
+        out.flush()
+        del out
+
+    def advance(self):
+        """Reserve the slot for one new row and return its index into data"""
         if self.length < self.maxlen:
             # We have space, simply increase the length.
             self.length += 1
@@ -31,31 +120,245 @@ class RingBuffer(object):
         else:
             # This should never happen.
             raise RuntimeError()
-        self.data[(self.start + self.length - 1) % self.maxlen] = v
+        return (self.start + self.length - 1) % self.maxlen
+
+    def extend(self, block):
+        """Append every row of block, using at most two contiguous slice
+        copies when the write wraps past the end of the ring.
+        """
+        n = len(block)
+        if n == 0:
+            return
+        if n > self.maxlen:
+            # Only the newest maxlen rows would survive anyway.
+            block = block[-self.maxlen:]
+            n = self.maxlen
+        end = (self.start + self.length) % self.maxlen
+        first = min(n, self.maxlen - end)
+        self.data[end:end + first] = block[:first]
+        if first < n:
+            self.data[:n - first] = block[first:]
+        overflow = max(0, self.length + n - self.maxlen)
+        self.start = (self.start + overflow) % self.maxlen
+        self.length = min(self.length + n, self.maxlen)
 
 def array_min2d(x):
-    x = np.array(x)
+    x = np.asarray(x)
     if x.ndim >= 2:
         return x
     return x.reshape(-1, 1)
 
+def take_rows(data, idxs, out=None):
+    """data[idxs], gathered into out when given"""
+    if out is None:
+        return data[idxs]
+    # idxs are always valid ring slots; the default mode="raise" would gather
+    # into a temporary array first
+    return np.take(data, idxs, axis=0, out=out, mode="clip")
+
+def split_batch(batch, n_batches):
+    """Split a batch dict of n_batches * batch_size rows into n_batches
+    batch dicts (views into the same arrays). Rows are dealt out strided so
+    that each batch spans every stratum of a prioritized draw.
+    """
+    return [{k: v[i::n_batches] for k, v in batch.items()} for i in range(n_batches)]
+
 class ReplayBuffer(object):
-    def __init__(self, limit, action_shape, observation_shape):
+    def __init__(self, limit, action_shape, observation_shape, packed=False, directory=None,
+                 prioritized=False, alpha=0.6, beta=0.4, priority_eps=1e-6):
+        """packed=True stores each transition as one float32 row
+        [obs0, action, reward, obs1] in a single preallocated ring, so append
+        and sample touch one contiguous row per transition instead of four
+        separate arrays.
+        directory, if given, backs every ring with a np.memmap file there;
+        an existing buffer in directory is resumed (see sync).
+        prioritized=True samples proportionally to (|TD error| + priority_eps)^alpha
+        using a sum-tree over ring slots; sample then also returns importance
+        weights (exponent beta) and the slots to pass to update_priorities.
+        """
         self.limit = limit
+        self.packed = packed
+        self.action_shape = tuple(action_shape)
+        self.observation_shape = tuple(observation_shape)
+        self.directory = directory
+        if directory is not None and not os.path.exists(directory):
+            os.makedirs(directory)
 
-        self.observations0 = RingBuffer(limit, shape=observation_shape)
-        self.actions = RingBuffer(limit, shape=action_shape)
-        self.rewards = RingBuffer(limit, shape=(1,))
-        self.observations1 = RingBuffer(limit, shape=observation_shape)
+        if packed:
+            obs_dim = int(np.prod(observation_shape))
+            action_dim = int(np.prod(action_shape))
+            self.obs0_cols = slice(0, obs_dim)
+            self.action_cols = slice(obs_dim, obs_dim + action_dim)
+            self.reward_cols = slice(obs_dim + action_dim, obs_dim + action_dim + 1)
+            self.obs1_cols = slice(obs_dim + action_dim + 1, 2 * obs_dim + action_dim + 1)
+            self.transitions = RingBuffer(limit, shape=(self.obs1_cols.stop,), filename=self.ring_file('transitions'))
+        else:
+            self.observations0 = RingBuffer(limit, shape=self.observation_shape, filename=self.ring_file('obs0'))
+            self.actions = RingBuffer(limit, shape=self.action_shape, filename=self.ring_file('actions'))
+            self.rewards = RingBuffer(limit, shape=(1,), filename=self.ring_file('rewards'))
+            self.observations1 = RingBuffer(limit, shape=self.observation_shape, filename=self.ring_file('obs1'))
 
-    def sample(self, batch_size):
-        # Draw such that we always have a proceeding element.
-        batch_idxs = np.random.random_integers(self.nb_entries - 2, size=batch_size)
+        if directory is not None:
+            self.resume()
+
+        self.prioritized = prioritized
+        if prioritized:
+            self.alpha = alpha
+            self.beta = beta
+            self.priority_eps = priority_eps
+            self.max_priority = 1.0
+            self.sum_tree = SumTree(limit)
+            self.min_tree = MinTree(limit)
+            # PrefetchSampler searches the trees on its own thread while
+            # the learner updates priorities
+            self.tree_lock = threading.Lock()
+            self.set_max_priority(self.nb_entries)
+
+    def last_slots(self, n):
+        """Indices into the ring data of the n most recently written rows"""
+        ring = next(iter(self.rings().values()))
+        n = min(n, ring.maxlen)
+        return (ring.start + ring.length - n + np.arange(n)) % ring.maxlen
+
+    def set_max_priority(self, n):
+        """New transitions get the highest priority seen so far"""
+        if n == 0:
+            return
+        slots = self.last_slots(n)
+        with self.tree_lock:
+            p = self.max_priority ** self.alpha
+            self.sum_tree.update(slots, p)
+            self.min_tree.update(slots, p)
+
+    def update_priorities(self, slots, td_errors):
+        if len(slots) == 0:
+            return
+        priorities = np.abs(np.ravel(td_errors)) + self.priority_eps
+        p = priorities ** self.alpha
+        with self.tree_lock:
+            self.max_priority = max(self.max_priority, priorities.max())
+            self.sum_tree.update(slots, p)
+            self.min_tree.update(slots, p)
+
+    def sample_prioritized_slots(self, batch_size):
+        """Stratified proportional draw; returns ring slots and normalized
+        importance weights
+        """
+        with self.tree_lock:
+            total = self.sum_tree.reduce()
+            segment = total / batch_size
+            prefixsums = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+            slots = self.sum_tree.find_prefixsum_idx(prefixsums)
+            # Guard against round-off landing on an empty leaf past the filled region.
+            slots = np.minimum(slots, self.nb_entries - 1)
+            p_min = self.min_tree.reduce() / total
+            p = self.sum_tree[slots] / total
+
+        n = self.nb_entries
+        max_weight = (n * p_min) ** (-self.beta)
+        weights = (n * p) ** (-self.beta) / max_weight
+        return slots, weights.reshape(-1, 1).astype('float32')
+
+    def rings(self):
+        """Name -> RingBuffer for every ring holding transition data"""
+        if self.packed:
+            return {'transitions': self.transitions}
+        return {
+            'obs0': self.observations0,
+            'actions': self.actions,
+            'rewards': self.rewards,
+            'obs1': self.observations1,
+        }
+
+    def ring_file(self, name):
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, name + '.npy')
+
+    def header(self):
+        return {
+            'limit': self.limit,
+            'packed': self.packed,
+            'action_shape': list(self.action_shape),
+            'observation_shape': list(self.observation_shape),
+        }
 
-        obs0_batch = self.observations0.get_batch(batch_idxs)
-        obs1_batch = self.observations1.get_batch(batch_idxs)
-        action_batch = self.actions.get_batch(batch_idxs)
-        reward_batch = self.rewards.get_batch(batch_idxs)
+    def sync(self):
+        """Flush memory-mapped rings to disk and record their start/length so
+        the buffer can be resumed. No-op for in-RAM buffers.
+        """
+        if self.directory is None:
+            return
+        meta = self.header()
+        meta['rings'] = {}
+        for name, ring in self.rings().items():
+            ring.data.flush()
+            meta['rings'][name] = [ring.start, ring.length]
+        filename = os.path.join(self.directory, 'buffer.json')
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(filename + '.tmp', filename)
+
+    def resume(self):
+        """Restore start/length written by sync if the files on disk belong to
+        a buffer with the same layout
+        """
+        filename = os.path.join(self.directory, 'buffer.json')
+        if not os.path.exists(filename):
+            return
+        with open(filename, 'r') as f:
+            meta = json.load(f)
+        if {k: meta.get(k) for k in self.header()} != self.header():
+            return
+        for name, ring in self.rings().items():
+            ring.start, ring.length = meta['rings'][name]
+
+    def save(self, path, compress=False):
+        """Snapshot the stored transitions to directory path (see save_rings)"""
+        save_rings(path, self.header(), self.rings(), compress=compress)
+
+    def load(self, path):
+        """Replace the contents of the buffer with a snapshot from save"""
+        load_rings(path, self.header(), self.rings())
+        if self.prioritized:
+            with self.tree_lock:
+                self.max_priority = 1.0
+                self.sum_tree = SumTree(self.limit)
+                self.min_tree = MinTree(self.limit)
+            self.set_max_priority(self.nb_entries)
+        self.sync()
+
+    def batch_buffer(self, batch_size):
+        """Preallocated arrays that sample(batch_size, out=...) gathers into"""
+        rings = self.rings()
+        return {name: np.empty((batch_size,) + ring.data.shape[1:], dtype=ring.data.dtype)
+                for name, ring in rings.items()}
+
+    def sample(self, batch_size, out=None):
+        """out, from batch_buffer(batch_size), receives the gathered rows
+        instead of new arrays, and the returned batch holds views into it
+        """
+        if out is None:
+            out = {}
+        if self.prioritized:
+            slots, weights = self.sample_prioritized_slots(batch_size)
+        else:
+            # Draw such that we always have a proceeding element.
+            batch_idxs = np.random.random_integers(self.nb_entries - 2, size=batch_size)
+            ring = next(iter(self.rings().values()))
+            slots = (ring.start + batch_idxs) % ring.maxlen
+
+        if self.packed:
+            rows = take_rows(self.transitions.data, slots, out.get('transitions'))
+            obs0_batch = rows[:, self.obs0_cols].reshape((-1,) + self.observation_shape)
+            obs1_batch = rows[:, self.obs1_cols].reshape((-1,) + self.observation_shape)
+            action_batch = rows[:, self.action_cols].reshape((-1,) + self.action_shape)
+            reward_batch = rows[:, self.reward_cols]
+        else:
+            obs0_batch = take_rows(self.observations0.data, slots, out.get('obs0'))
+            obs1_batch = take_rows(self.observations1.data, slots, out.get('obs1'))
+            action_batch = take_rows(self.actions.data, slots, out.get('actions'))
+            reward_batch = take_rows(self.rewards.data, slots, out.get('rewards'))
 
         result = {
             'obs0': array_min2d(obs0_batch),
@@ -63,50 +366,229 @@ class ReplayBuffer(object):
             'rewards': array_min2d(reward_batch),
             'actions': array_min2d(action_batch),
         }
+        if self.prioritized:
+            result['weights'] = weights
+            result['idxs'] = slots
         return result
 
+    def sample_many(self, n_batches, batch_size, out=None):
+        """Draw n_batches batches with one vectorized index draw and gather
+        (into out, from batch_buffer(n_batches * batch_size), when given).
+        Prioritized draws all use the priorities as of this call.
+        """
+        return split_batch(self.sample(n_batches * batch_size, out), n_batches)
+
     def append(self, obs0, action, reward, obs1, _, training=True):
         if not training:
             return
 
-        self.observations0.append(obs0)
-        self.actions.append(action)
-        self.rewards.append(reward)
-        self.observations1.append(obs1)
+        if self.packed:
+            row = self.transitions.data[self.transitions.advance()]
+            row[self.obs0_cols] = np.ravel(obs0)
+            row[self.action_cols] = np.ravel(action)
+            row[self.reward_cols] = reward
+            row[self.obs1_cols] = np.ravel(obs1)
+        else:
+            self.observations0.append(obs0)
+            self.actions.append(action)
+            self.rewards.append(reward)
+            self.observations1.append(obs1)
+
+        if self.prioritized:
+            self.set_max_priority(1)
+
+    def extend(self, obs0, actions, rewards, obs1, training=True):
+        """Append a block of N transitions at once"""
+        if not training:
+            return
+
+        if self.packed:
+            n = len(obs0)
+            block = np.empty((n, self.obs1_cols.stop), dtype='float32')
+            block[:, self.obs0_cols] = np.reshape(obs0, (n, -1))
+            block[:, self.action_cols] = np.reshape(actions, (n, -1))
+            block[:, self.reward_cols] = np.reshape(rewards, (n, 1))
+            block[:, self.obs1_cols] = np.reshape(obs1, (n, -1))
+            self.transitions.extend(block)
+        else:
+            self.observations0.extend(obs0)
+            self.actions.extend(actions)
+            self.rewards.extend(np.reshape(rewards, (-1, 1)))
+            self.observations1.extend(obs1)
+
+        if self.prioritized:
+            self.set_max_priority(len(obs0))
 
     @property
     def nb_entries(self):
+        if self.packed:
+            return len(self.transitions)
         return len(self.observations0)
 
 class HERBuffer(ReplayBuffer):
-    def __init__(self, limit, action_shape, observation_shape, obs_to_goal, goal_slice, reward_fn):
+    def __init__(self, limit, action_shape, observation_shape, obs_to_goal, goal_slice, reward_fn, **kwargs):
         """Replay buffer that does Hindsight Experience Replay
         obs_to_goal is a function that converts observations to goals
         goal_slice is a slice of indices of goal in observation
+        kwargs are the storage/sampling options of ReplayBuffer
         """
-        ReplayBuffer.__init__(self, limit, action_shape, observation_shape)
+        ReplayBuffer.__init__(self, limit, action_shape, observation_shape, **kwargs)
+
+        self.obs_to_goal = obs_to_goal
+        self.goal_slice = goal_slice
+        self.reward_fn = reward_fn
+        self.data = [] # stores current episode
+
+    def flush(self):
+        """Dump the current episode into the replay buffer with (final) HER.
+        The episode is stacked once and written/relabeled as whole blocks,
+        so reward_fn has to accept a batch of observations.
+        """
+        if not self.data:
+            return
+
+        obs0, actions, rewards, obs1 = [np.array(x, dtype='float32') for x in zip(*self.data)]
+        self.extend(obs0, actions, rewards, obs1)
+
+        # The rings copied the originals, so relabel the stacked arrays in place.
+        her_goal = self.obs_to_goal(obs1[-1])
+        obs0[:, self.goal_slice] = her_goal
+        obs1[:, self.goal_slice] = her_goal
+        rewards = self.reward_fn(obs1)
+        self.extend(obs0, actions, rewards, obs1)
+        self.data = []
+        self.sync()
+
+    def load(self, path):
+        ReplayBuffer.load(self, path)
+        self.data = []
+
+    def append(self, obs0, action, reward, obs1, _, training=True):
+        if not training:
+            return
 
+        self.data.append((obs0, action, reward, obs1))
+
+class EpisodeHERBuffer(object):
+    def __init__(self, limit, action_shape, observation_shape, obs_to_goal, goal_slice, reward_fn,
+                 episode_length, strategy="future", relabel_ratio=0.8):
+        """Hindsight Experience Replay that stores every episode once and
+        relabels goals when a batch is sampled.
+        strategy picks the substitute goal for a transition at step t:
+            "final": the achieved goal at the end of the episode
+            "future": an achieved goal later in the same episode
+            "episode": any achieved goal in the same episode
+            "random": an achieved goal anywhere in the buffer
+        relabel_ratio is the fraction of each batch that gets a new goal
+        (1 - 1 / (1 + k) for k relabeled samples per original).
+        """
+        assert strategy in ("final", "future", "episode", "random")
+        self.limit = limit
+        self.episode_length = episode_length
         self.obs_to_goal = obs_to_goal
         self.goal_slice = goal_slice
         self.reward_fn = reward_fn
+        self.strategy = strategy
+        self.relabel_ratio = relabel_ratio
+
+        max_episodes = max(1, limit // episode_length)
+        # observations[e, t] is obs0 of step t, observations[e, t + 1] its obs1
+        self.observations = RingBuffer(max_episodes, shape=(episode_length + 1,) + tuple(observation_shape))
+        self.actions = RingBuffer(max_episodes, shape=(episode_length,) + tuple(action_shape))
+        self.rewards = RingBuffer(max_episodes, shape=(episode_length,))
+        self.lengths = RingBuffer(max_episodes, shape=(), dtype='int64')
+        self.nb_transitions = 0 # sum of the stored episodes' lengths
         self.data = [] # stores current episode
 
+    def rings(self):
+        return {
+            'observations': self.observations,
+            'actions': self.actions,
+            'rewards': self.rewards,
+            'lengths': self.lengths,
+        }
+
+    def header(self):
+        return {
+            'limit': self.limit,
+            'episode_length': self.episode_length,
+            'action_shape': list(self.actions.data.shape[2:]),
+            'observation_shape': list(self.observations.data.shape[2:]),
+        }
+
+    def save(self, path, compress=False):
+        save_rings(path, self.header(), self.rings(), compress=compress)
+
+    def load(self, path):
+        load_rings(path, self.header(), self.rings())
+        self.nb_transitions = int(self.lengths.ordered().sum())
+        self.data = []
+
+    def sample_episode_slots(self, batch_size):
+        """Uniformly drawn indices into the episode rings' data"""
+        idxs = np.random.randint(len(self.lengths), size=batch_size)
+        return (self.lengths.start + idxs) % self.lengths.maxlen
+
+    def sample(self, batch_size):
+        ep_slots = self.sample_episode_slots(batch_size)
+        lengths = self.lengths.data[ep_slots]
+        t = (np.random.random(batch_size) * lengths).astype('int64')
+
+        obs0 = self.observations.data[ep_slots, t]
+        obs1 = self.observations.data[ep_slots, t + 1]
+        actions = self.actions.data[ep_slots, t]
+        rewards = self.rewards.data[ep_slots, t]
+
+        relabel = np.random.random(batch_size) < self.relabel_ratio
+        goal_slots = ep_slots
+        if self.strategy == "final":
+            goal_t = lengths
+        elif self.strategy == "future":
+            goal_t = t + 1 + (np.random.random(batch_size) * (lengths - t)).astype('int64')
+        elif self.strategy == "episode":
+            goal_t = 1 + (np.random.random(batch_size) * lengths).astype('int64')
+        else:
+            goal_slots = self.sample_episode_slots(batch_size)
+            goal_t = 1 + (np.random.random(batch_size) * self.lengths.data[goal_slots]).astype('int64')
+
+        goal_slots, goal_t = goal_slots[relabel], goal_t[relabel]
+        her_goals = self.obs_to_goal(self.observations.data[goal_slots, goal_t])
+        obs0[relabel, self.goal_slice] = her_goals
+        obs1[relabel, self.goal_slice] = her_goals
+        rewards[relabel] = self.reward_fn(obs1[relabel])
+
+        result = {
+            'obs0': array_min2d(obs0),
+            'obs1': array_min2d(obs1),
+            'rewards': array_min2d(rewards),
+            'actions': array_min2d(actions),
+        }
+        return result
+
+    def sample_many(self, n_batches, batch_size):
+        return split_batch(self.sample(n_batches * batch_size), n_batches)
+
     def flush(self):
-        """Dump the current data into the replay buffer with (final) HER"""
+        """Store the current episode as one row of each episode ring"""
         if not self.data:
             return
 
-        for obs0, action, reward, obs1 in self.data:
-            obs0, action, reward, obs1 = obs0.copy(), action.copy(), reward.copy(), obs1.copy()
-            super().append(obs0, action, reward, obs1, None)
-        final_obs = self.data[-1][-1]
-        her_goal = self.obs_to_goal(final_obs)
-        for obs0, action, reward, obs1 in self.data:
-            obs0, action, reward, obs1 = obs0.copy(), action.copy(), reward.copy(), obs1.copy()
-            obs0[self.goal_slice] = her_goal
-            obs1[self.goal_slice] = her_goal
-            reward =self.reward_fn(obs1)
-            super().append(obs0, action, reward, obs1, None)
+        obs0, actions, rewards, obs1 = [np.array(x, dtype='float32') for x in zip(*self.data)]
+        n = len(self.data)
+        assert n <= self.episode_length
+        if len(self.lengths) == self.lengths.maxlen:
+            # the oldest episode is about to be overwritten
+            self.nb_transitions -= int(self.lengths.data[self.lengths.start])
+        slot = self.lengths.advance()
+        self.observations.advance()
+        self.actions.advance()
+        self.rewards.advance()
+        self.observations.data[slot, :n] = obs0
+        self.observations.data[slot, n] = obs1[-1]
+        self.actions.data[slot, :n] = actions
+        self.rewards.data[slot, :n] = rewards
+        self.lengths.data[slot] = n
+        self.nb_transitions += n
         self.data = []
 
     def append(self, obs0, action, reward, obs1, _, training=True):
@@ -117,4 +599,4 @@ class HERBuffer(ReplayBuffer):
 
     @property
     def nb_entries(self):
-        return len(self.observations0)
+        return self.nb_transitions
@@ -0,0 +1,209 @@
+"""Rollout collection in worker processes.
+
+Each worker owns its own env and a NumPy copy of the actor, and writes the
+transitions it collects into a block of shared memory that the learner
+copies into its replay buffer. Requests and small results (episode stats,
+simulator states for the saved rollout) go over a Pipe.
+
+The shared blocks are multiprocessing.RawArray buffers viewed as NumPy
+arrays, which works on the Python 3.5 of our Docker image
+(multiprocessing.shared_memory needs 3.8).
+"""
+
+from multiprocessing import Process, Pipe, RawArray
+import numpy as np
+import pdb
+
+from ss.utils.rollout import Rollout
+
+LAYER_NORM_EPSILON = 1e-12 # tc.layers.layer_norm default
+WORKER_POLL_TIMEOUT = 1. # seconds between liveness checks while waiting on a worker
+
+def actor_forward(obs, params, layer_norm=True):
+    """NumPy version of ss.algos.models.Actor.
+    params maps variable names relative to the actor scope (e.g.
+    "dense/kernel", "LayerNorm/gamma") to their values.
+    """
+    x = obs
+    for dense, ln in [("dense", "LayerNorm"), ("dense_1", "LayerNorm_1")]:
+        x = x.dot(params[dense + "/kernel"]) + params[dense + "/bias"]
+        if layer_norm:
+            mean = x.mean(axis=-1, keepdims=True)
+            var = x.var(axis=-1, keepdims=True)
+            x = (x - mean) / np.sqrt(var + LAYER_NORM_EPSILON)
+            x = x * params[ln + "/gamma"] + params[ln + "/beta"]
+        x = np.maximum(x, 0.)
+    x = x.dot(params["dense_2/kernel"]) + params["dense_2/bias"]
+    return np.tanh(x)
+
+class Policy(object):
+    """What a worker needs to act: actor weights, observation normalization
+    and noise settings (see DDPG.get_actor_policy)
+    """
+    def __init__(self, actor_params, obs_mean, obs_std, observation_range, action_range, noise_sigma, layer_norm):
+        self.actor_params = actor_params
+        self.obs_mean = obs_mean
+        self.obs_std = obs_std
+        self.observation_range = observation_range
+        self.action_range = action_range
+        self.noise_sigma = noise_sigma
+        self.layer_norm = layer_norm
+
+    def __call__(self, obs, apply_noise=True):
+        x = obs
+        if self.obs_mean is not None:
+            x = (x - self.obs_mean) / self.obs_std
+        x = np.clip(x, self.observation_range[0], self.observation_range[1])
+        action = actor_forward(x, self.actor_params, self.layer_norm)
+        if apply_noise:
+            action = action + np.random.normal(0., self.noise_sigma, size=action.shape)
+        return np.clip(action, self.action_range[0], self.action_range[1])
+
+def worker(remote, env_type, env_kwargs, seed, horizon, nb_episodes, blocks):
+    """blocks: (2, nb_episodes * horizon, width) shared view, one slot being
+    written while the learner may still be reading the other
+    """
+    np.random.seed(seed)
+    env = env_type(**env_kwargs)
+    env.seed(seed)
+    max_action = env.action_space.high
+    obs_dim = env.observation_space.shape[0]
+    action_dim = env.action_space.shape[0]
+    policy = None
+    while True:
+        cmd, data = remote.recv()
+        if cmd == "close":
+            env.close()
+            remote.close()
+            return
+        assert cmd == "collect"
+        slot, new_policy, record = data
+        if new_policy is not None:
+            policy = new_policy
+
+        block = blocks[slot]
+        episode_rewards = []
+        episode_success = []
+        states = []
+        row = 0
+        for episode in range(nb_episodes):
+            obs = env.reset()
+            episode_reward = 0.
+            for t in range(horizon):
+                if record and episode == 0:
+                    states.append(env.get_state_data())
+                action = policy(obs)
+                new_obs, r, done, info = env.step(max_action * action)
+                block[row, :obs_dim] = obs
+                block[row, obs_dim:obs_dim + action_dim] = action
+                block[row, obs_dim + action_dim] = r
+                block[row, obs_dim + action_dim + 1:] = new_obs
+                episode_reward += r
+                obs = new_obs
+                row += 1
+            if record and episode == 0:
+                states.append(env.get_state_data())
+            episode_rewards.append(episode_reward)
+            episode_success.append(r + 1)
+        remote.send((episode_rewards, episode_success, states))
+
+class RolloutWorkerPool(object):
+    def __init__(self, env_type, nb_workers, horizon, nb_episodes, observation_shape, action_shape, seed=0, env_kwargs=None):
+        """nb_workers processes that each collect nb_episodes episodes of
+        horizon steps per request. Transitions come back as packed
+        [obs0, action, reward, obs1] float32 rows in shared memory.
+        """
+        if env_kwargs is None:
+            env_kwargs = {}
+        self.nb_workers = nb_workers
+        self.horizon = horizon
+        self.nb_episodes = nb_episodes
+        self.obs_dim = observation_shape[0]
+        self.action_dim = action_shape[0]
+        self.width = 2 * self.obs_dim + self.action_dim + 1
+        rows = nb_episodes * horizon
+
+        shared = RawArray('f', nb_workers * 2 * rows * self.width)
+        self.blocks = np.frombuffer(shared, dtype='float32').reshape(nb_workers, 2, rows, self.width)
+        self.slot = 0
+        self.pending = False
+
+        self.remotes = []
+        self.processes = []
+        for i in range(nb_workers):
+            remote, worker_remote = Pipe()
+            p = Process(target=worker, args=(worker_remote, env_type, env_kwargs, seed + 1 + i, horizon, nb_episodes, self.blocks[i]))
+            p.daemon = True
+            p.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(p)
+
+    def request(self, policy=None, record=False):
+        """Start collecting into the free slot. Workers keep acting with the
+        last policy they were sent when policy is None.
+        """
+        assert not self.pending
+        self.slot = 1 - self.slot
+        for remote in self.remotes:
+            remote.send(("collect", (self.slot, policy, record)))
+        self.pending = True
+
+    def ready(self):
+        """Whether every worker has finished the pending request"""
+        return self.pending and all(remote.poll() for remote in self.remotes)
+
+    def collect(self):
+        """Wait for the requested episodes. Returns, per worker and episode,
+        (obs0, actions, rewards, obs1) views into shared memory, plus the
+        episode rewards, successes and (if recorded) a Rollout of one episode.
+        """
+        assert self.pending
+        results = [self.recv(i) for i in range(self.nb_workers)]
+        self.pending = False
+
+        episodes = []
+        for block in self.blocks[:, self.slot]:
+            for e in range(self.nb_episodes):
+                rows = block[e * self.horizon:(e + 1) * self.horizon]
+                episodes.append((
+                    rows[:, :self.obs_dim],
+                    rows[:, self.obs_dim:self.obs_dim + self.action_dim],
+                    rows[:, self.obs_dim + self.action_dim],
+                    rows[:, self.obs_dim + self.action_dim + 1:],
+                ))
+        episode_rewards = [r for result in results for r in result[0]]
+        episode_success = [s for result in results for s in result[1]]
+
+        rollout = None
+        states = results[0][2]
+        if states:
+            rollout = Rollout()
+            obs0, actions, rewards, obs1 = episodes[0]
+            for state, action, r in zip(states, actions, rewards):
+                rollout.store_transition(state, action.copy(), r)
+            rollout.store_transition(states[-1], None, None) # store final state
+        return episodes, episode_rewards, episode_success, rollout
+
+    def recv(self, i):
+        """Result from worker i, raising if the worker has exited instead of
+        waiting on its pipe forever
+        """
+        remote, p = self.remotes[i], self.processes[i]
+        while not remote.poll(WORKER_POLL_TIMEOUT):
+            if not p.is_alive():
+                break
+        try:
+            return remote.recv()
+        except EOFError:
+            pass
+        p.join()
+        raise RuntimeError("rollout worker %d exited with code %s" % (i, p.exitcode))
+
+    def close(self):
+        if self.pending:
+            self.collect()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for p in self.processes:
+            p.join()
@@ -0,0 +1,78 @@
+"""Background prefetching of replay batches"""
+
+import threading
+import queue
+
+from ss.algos.replay_buffer import split_batch
+
+def sample_many(memory, n_batches, batch_size, out=None):
+    """out (from memory.batch_buffer) is only used by memories that have one"""
+    if hasattr(memory, 'batch_buffer'):
+        return memory.sample_many(n_batches, batch_size, out)
+    if hasattr(memory, 'sample_many'):
+        return memory.sample_many(n_batches, batch_size)
+    # e.g. baselines Memory
+    return split_batch(memory.sample(batch_size=n_batches * batch_size), n_batches)
+
+class PrefetchSampler(object):
+    def __init__(self, memory, batch_size, n_prefetch):
+        """Prepares replay batches on a worker thread while the learner is in
+        sess.run (which releases the GIL). Batches are drawn in chunks of
+        n_prefetch with one vectorized sample_many call, gathered into one of
+        two preallocated buffers (when the memory has batch_buffer): the
+        learner trains on one chunk while the next is drawn into the other,
+        and a buffer is refilled as soon as the learner moves past it.
+        Only request batches once the buffer is no longer being written to
+        (i.e. after the rollouts of a cycle).
+        """
+        self.memory = memory
+        self.batch_size = batch_size
+        self.n_prefetch = n_prefetch
+        self.requests = queue.Queue()
+        self.chunks = queue.Queue()
+        self.free = queue.Queue() # buffers the worker may draw into
+        for _ in range(2):
+            if hasattr(memory, 'batch_buffer'):
+                self.free.put(memory.batch_buffer(n_prefetch * batch_size))
+            else:
+                self.free.put(None)
+        self.current = []
+        self.buffer = None # backs the batches in current
+        self.holding = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def request(self, n_batches):
+        """Schedule n_batches batches to be drawn, e.g. one cycle's nb_train_steps"""
+        self.requests.put(n_batches)
+
+    def get(self):
+        """Next prefetched batch (blocks until it is ready). Batches stay
+        valid until the get after the last batch of their chunk.
+        """
+        if not self.current:
+            if self.holding:
+                # the learner is done with the previous chunk
+                self.free.put(self.buffer)
+            self.buffer, self.current = self.chunks.get()
+            self.holding = True
+        return self.current.pop(0)
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            n_batches = self.requests.get()
+            if n_batches is None:
+                return
+            while n_batches > 0:
+                k = min(n_batches, self.n_prefetch)
+                buffer = self.free.get()
+                out = None
+                if buffer is not None:
+                    out = {name: rows[:k * self.batch_size] for name, rows in buffer.items()}
+                self.chunks.put((buffer, sample_many(self.memory, k, self.batch_size, out)))
+                n_batches -= k
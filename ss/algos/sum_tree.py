@@ -0,0 +1,59 @@
+"""Array-based segment trees for prioritized experience replay.
+All operations take batches of indices and walk the tree one level at a time,
+so an update or a batched search costs O(log N) NumPy calls.
+"""
+
+import numpy as np
+
+class SegmentTree(object):
+    def __init__(self, capacity, operation, neutral_element):
+        """operation is a binary ufunc (np.add, np.minimum) and
+        neutral_element its identity, used for empty leaves
+        """
+        self.capacity = capacity
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.operation = operation
+        self.neutral_element = neutral_element
+        self.tree = np.full(2 * self.size, neutral_element, dtype='float64')
+
+    def __getitem__(self, idxs):
+        return self.tree[np.asarray(idxs) + self.size]
+
+    def update(self, idxs, values):
+        """Set leaves idxs to values and recompute their ancestors"""
+        nodes = np.asarray(idxs, dtype='int64') + self.size
+        if len(nodes) == 0:
+            return
+        self.tree[nodes] = values
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.operation(self.tree[2 * nodes], self.tree[2 * nodes + 1])
+            nodes = np.unique(nodes // 2)
+
+    def reduce(self):
+        """Result of operation over all leaves"""
+        return self.tree[1]
+
+class SumTree(SegmentTree):
+    def __init__(self, capacity):
+        SegmentTree.__init__(self, capacity, np.add, 0.0)
+
+    def find_prefixsum_idx(self, prefixsums):
+        """For each value v, the highest leaf i with sum(leaves[:i]) <= v.
+        Descends the tree for the whole batch at once.
+        """
+        values = np.array(prefixsums, dtype='float64')
+        nodes = np.ones(len(values), dtype='int64')
+        while nodes[0] < self.size:
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values = np.where(go_right, values - left_sum, values)
+            nodes = np.where(go_right, left + 1, left)
+        return np.minimum(nodes - self.size, self.capacity - 1)
+
+class MinTree(SegmentTree):
+    def __init__(self, capacity):
+        SegmentTree.__init__(self, capacity, np.minimum, np.inf)
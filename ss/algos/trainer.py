@@ -6,7 +6,9 @@ from collections import deque
 import pickle
 
 from ss.algos.ddpg import DDPG
-from baselines.ddpg.util import mpi_mean, mpi_std, mpi_max, mpi_sum
+from ss.algos.sampler import PrefetchSampler
+from ss.algos.rollout_workers import RolloutWorkerPool
+from ss.algos.mpi_stats import MpiStats
 import baselines.common.tf_util as U
 
 from baselines import logger
@@ -44,6 +46,9 @@ class Trainer:
         agent = DDPG(**self.params)
         logger.info('Using agent with the following configuration:')
         logger.info(str(agent.__dict__.items()))
+        if self.restore_buffer:
+            logger.info('restoring replay buffer from {}'.format(self.restore_buffer))
+            agent.memory.load(self.restore_buffer)
 
         # Set up logging stuff only for a single worker.
         if rank == 0:
@@ -51,12 +56,33 @@ class Trainer:
         else:
             saver = None
 
+        if self.prefetch_batches > 0:
+            sampler = PrefetchSampler(agent.memory, self.batch_size, self.prefetch_batches)
+        else:
+            sampler = None
+
+        if self.async_collect:
+            assert self.nb_rollout_workers > 0, "async_collect needs rollout workers"
+            # each rank would collect a timing-dependent number of episodes, so
+            # the obs_rms and MpiAdam collectives would not line up across ranks
+            assert MPI.COMM_WORLD.Get_size() == 1, "async_collect does not support MPI"
+        if self.nb_rollout_workers > 0:
+            # Started before the session so the forked workers hold no TF state.
+            workers = RolloutWorkerPool(self.env_type, self.nb_rollout_workers, self.horizon,
+                self.worker_episodes, self.observation_shape, self.action_shape, seed=self.seed,
+                env_kwargs=self.env_kwargs)
+        else:
+            workers = None
+
         step = 0
         episode = 0
         with U.single_threaded_session() as sess:
             # Prepare everything.
             agent.initialize(sess)
             sess.graph.finalize()
+            if workers:
+                workers.request(agent.get_actor_policy(), record=True)
+            policy = None
 
             agent.reset()
             obs = env.reset()
@@ -65,6 +91,7 @@ class Trainer:
             episode_step = 0
             episodes = 0
             t = 0
+            train_steps = 0
 
             epoch = 0
             start_time = time.time()
@@ -79,88 +106,181 @@ class Trainer:
                 epoch_episode_success = []
                 epoch_actions = []
                 epoch_qs = []
+                epoch_obs = [] # for the once-per-epoch Q estimate
                 epoch_actor_losses = []
                 epoch_critic_losses = []
 
-                for cycle in range(self.nb_epoch_cycles):
-                    # Perform rollouts.
-
-                    rollout = Rollout()
-                    for t_rollout in range(self.horizon):
-                        # Predict next action.
-                        action, q = agent.pi(obs, apply_noise=True, compute_Q=True)
-                        state = env.get_state_data()
-                        assert action.shape == env.action_space.shape
-
-                        # Execute next action.
-                        if rank == 0 and self.render:
-                            env.render()
-                        assert max_action.shape == action.shape
-                        new_obs, r, done, info = env.step(max_action * action)  # scale for execution in env (as far as DDPG is concerned, every action is in [-1, 1])
-
-                        rollout.store_transition(state, action, r)
-                        t += 1
-                        if rank == 0 and self.render:
-                            env.render()
-                        episode_reward += r
-                        episode_step += 1
-
-                        # Book-keeping.
-                        epoch_actions.append(action)
-                        epoch_qs.append(q)
-                        agent.store_transition(obs, action, r, new_obs, done)
-                        obs = new_obs
-
-                    state = env.get_state_data()
-                    rollout.store_transition(state, None, None) # store final state
-                    if cycle == 0: # save 1 rollout per epoch
-                        rollouts.append(rollout)
-
-                    epoch_episode_rewards.append(episode_reward)
-                    epoch_episode_success.append(r + 1)
-                    epoch_episode_steps.append(episode_step)
-                    episode_reward = 0.
-                    episode_step = 0
-                    epoch_episodes += 1
-                    episodes += 1
-
-                    agent.reset()
-                    obs = env.reset()
-
-                    # Train.
-                    for t_train in range(self.nb_train_steps):
-                        cl, al = agent.train()
-                        epoch_critic_losses.append(cl)
-                        epoch_actor_losses.append(al)
-                agent.update_target_net()
+                if self.async_collect:
+                    # Collection runs in the workers while we train; keep the number of
+                    # train steps at update_to_data_ratio per collected env step.
+                    epoch_train_steps = 0
+                    # epoch 0's recorded rollout was requested before the loop
+                    record = epoch > 0
+                    while epoch_train_steps < self.nb_epoch_cycles * self.nb_train_steps:
+                        if train_steps >= self.update_to_data_ratio * t or workers.ready():
+                            collected, rewards, success, rollout = workers.collect()
+                            workers.request(policy, record=record)
+                            policy = None
+                            record = False
+                            if rollout:
+                                rollouts.append(rollout)
+                            t += self.store_worker_episodes(agent, collected, epoch_actions, epoch_obs)
+                            if self.obs_rms_update_freq == "cycle":
+                                agent.update_obs_rms()
+                            epoch_episode_rewards.extend(rewards)
+                            epoch_episode_success.extend(success)
+                            epoch_episode_steps.extend([self.horizon] * len(collected))
+                            epoch_episodes += len(collected)
+                            episodes += len(collected)
+                        else:
+                            cl, al = agent.train()
+                            epoch_critic_losses.append(cl)
+                            epoch_actor_losses.append(al)
+                            train_steps += 1
+                            epoch_train_steps += 1
+                            if self.target_update_freq == "cycle" and train_steps % self.nb_train_steps == 0:
+                                agent.update_target_net()
+                            if train_steps % self.weight_sync_freq == 0:
+                                policy = agent.get_actor_policy()
+                else:
+                    for cycle in range(self.nb_epoch_cycles):
+                        # Perform rollouts.
+
+                        if workers:
+                            collected, rewards, success, rollout = workers.collect()
+                            # Workers collect the next cycle into the other shared slot while
+                            # this one is stored and trained on, with the weights from the end
+                            # of the previous cycle's training.
+                            workers.request(agent.get_actor_policy(), record=(cycle == self.nb_epoch_cycles - 1))
+                            if cycle == 0 and rollout: # save 1 rollout per epoch
+                                rollouts.append(rollout)
+                            t += self.store_worker_episodes(agent, collected, epoch_actions, epoch_obs)
+                            epoch_episode_rewards.extend(rewards)
+                            epoch_episode_success.extend(success)
+                            epoch_episode_steps.extend([self.horizon] * len(collected))
+                            epoch_episodes += len(collected)
+                            episodes += len(collected)
+                        elif self.nb_envs > 1:
+                            obs, rollout, rewards, success, actions, qs = self.vec_rollout(agent, env, obs, max_action, epoch_obs)
+                            if cycle == 0: # save 1 rollout per epoch
+                                rollouts.append(rollout)
+                            t += self.horizon * self.nb_envs
+                            epoch_episode_rewards.extend(rewards)
+                            epoch_episode_success.extend(success)
+                            epoch_episode_steps.extend([self.horizon] * self.nb_envs)
+                            epoch_actions.extend(actions)
+                            epoch_qs.extend(qs)
+                            epoch_episodes += self.nb_envs
+                            episodes += self.nb_envs
+                        else:
+                            rollout = Rollout()
+                            for t_rollout in range(self.horizon):
+                                # Predict next action.
+                                action, q = agent.pi(obs, apply_noise=True, compute_Q=self.sample_Q(t))
+                                state = env.get_state_data()
+                                assert action.shape == env.action_space.shape
+
+                                # Execute next action.
+                                if rank == 0 and self.render:
+                                    env.render()
+                                assert max_action.shape == action.shape
+                                new_obs, r, done, info = env.step(max_action * action)  # scale for execution in env (as far as DDPG is concerned, every action is in [-1, 1])
+
+                                rollout.store_transition(state, action, r)
+                                t += 1
+                                if rank == 0 and self.render:
+                                    env.render()
+                                episode_reward += r
+                                episode_step += 1
+
+                                # Book-keeping.
+                                epoch_actions.append(action)
+                                if q is not None:
+                                    epoch_qs.append(q)
+                                if self.q_sample_freq == 0:
+                                    epoch_obs.append(obs)
+                                agent.store_transition(obs, action, r, new_obs, done)
+                                obs = new_obs
+
+                            state = env.get_state_data()
+                            rollout.store_transition(state, None, None) # store final state
+                            if cycle == 0: # save 1 rollout per epoch
+                                rollouts.append(rollout)
+
+                            epoch_episode_rewards.append(episode_reward)
+                            epoch_episode_success.append(r + 1)
+                            epoch_episode_steps.append(episode_step)
+                            episode_reward = 0.
+                            episode_step = 0
+                            epoch_episodes += 1
+                            episodes += 1
+
+                            agent.reset()
+                            obs = env.reset()
+
+                        # Train.
+                        if self.obs_rms_update_freq == "cycle":
+                            agent.update_obs_rms()
+                        if agent.train_loop_in_graph:
+                            cls, als = agent.train_loop(self.nb_train_steps)
+                            epoch_critic_losses.extend(cls)
+                            epoch_actor_losses.extend(als)
+                            train_steps += self.nb_train_steps
+                        else:
+                            if sampler:
+                                sampler.request(self.nb_train_steps)
+                            for t_train in range(self.nb_train_steps):
+                                batch = sampler.get() if sampler else None
+                                cl, al = agent.train(batch)
+                                epoch_critic_losses.append(cl)
+                                epoch_actor_losses.append(al)
+                                train_steps += 1
+                        if self.target_update_freq == "cycle":
+                            agent.update_target_net()
+                if self.target_update_freq == "epoch":
+                    agent.update_target_net()
+                if self.async_collect:
+                    # Workers pick up the new weights with their next request.
+                    policy = agent.get_actor_policy()
+                # agent.get_stats and the epoch-level Q estimate are the
+                # expensive part; the rollout/train/total stats are kept every epoch.
+                log_stats = self.stats_freq > 0 and epoch % self.stats_freq == 0
+                epoch_q_batch = self.q_sample_freq == 0 or workers
+                if log_stats and epoch_q_batch:
+                    epoch_qs = list(agent.q_batch(np.array(epoch_obs)))
 
                 # Log stats.
                 epoch_train_duration = time.time() - epoch_start_time
                 duration = time.time() - start_time
-                stats = agent.get_stats()
-                combined_stats = {}
-                for key in sorted(stats.keys()):
-                    combined_stats[key] = mpi_mean(stats[key])
+                stats = MpiStats()
+                if log_stats:
+                    agent_stats = agent.get_stats()
+                    for key in sorted(agent_stats.keys()):
+                        stats.mean(key, agent_stats[key])
 
                 # Rollout statistics.
-                combined_stats['rollout/return'] = mpi_mean(epoch_episode_rewards)
-                combined_stats['rollout/success'] = mpi_mean(epoch_episode_success)
-                combined_stats['rollout/episode_steps'] = mpi_mean(epoch_episode_steps)
-                combined_stats['rollout/episodes'] = mpi_sum(epoch_episodes)
-                combined_stats['rollout/actions_mean'] = mpi_mean(epoch_actions)
-                combined_stats['rollout/actions_std'] = mpi_std(epoch_actions)
-                combined_stats['rollout/Q_mean'] = mpi_mean(epoch_qs)
+                stats.mean('rollout/return', epoch_episode_rewards)
+                stats.mean('rollout/success', epoch_episode_success)
+                stats.mean('rollout/episode_steps', epoch_episode_steps)
+                stats.sum('rollout/episodes', epoch_episodes)
+                stats.mean('rollout/actions_mean', epoch_actions)
+                stats.std('rollout/actions_std', epoch_actions)
+                if log_stats or not epoch_q_batch:
+                    stats.mean('rollout/Q_mean', epoch_qs)
 
                 # Train statistics.
-                combined_stats['train/loss_actor'] = mpi_mean(epoch_actor_losses)
-                combined_stats['train/loss_critic'] = mpi_mean(epoch_critic_losses)
+                stats.mean('train/loss_actor', epoch_actor_losses)
+                stats.mean('train/loss_critic', epoch_critic_losses)
 
                 # Total statistics.
-                combined_stats['total/duration'] = mpi_mean(duration)
-                combined_stats['total/steps_per_second'] = mpi_mean(float(t) / float(duration))
-                combined_stats['total/episodes'] = mpi_mean(episodes)
+                stats.mean('total/duration', duration)
+                stats.mean('total/steps_per_second', float(t) / float(duration))
+                stats.mean('total/episodes', episodes)
+                stats.mean('total/train_steps_per_second', float(train_steps) / float(duration))
+                combined_stats = stats.reduce()
                 combined_stats['total/epochs'] = epoch + 1
                 combined_stats['total/steps'] = t
+                combined_stats['total/train_steps'] = train_steps
 
                 for key in sorted(combined_stats.keys()):
                     logger.record_tabular(key, combined_stats[key])
@@ -176,6 +296,10 @@ class Trainer:
                         with open(os.path.join(logdir, 'policies/agent_%d.pkl' % epoch), 'wb') as f:
                             pickle.dump(agent, f)
 
+                        if self.save_buffer:
+                            agent.memory.save(os.path.join(logdir, 'replay_buffer_snapshot'),
+                                compress=self.save_buffer_compress)
+
                         with open(os.path.join(logdir, 'rollouts/rollouts_%d.pkl' % epoch), 'wb') as f:
                             pickle.dump(rollouts, f)
                         rollouts = []
@@ -183,6 +307,81 @@ class Trainer:
                         # todo: break this out into its own frequency parameter (one for sync, one for dumping the agent)
                         s3.sync_up_expdir()
 
+        if sampler:
+            sampler.close()
+        if workers:
+            workers.close()
+
+    def store_worker_episodes(self, agent, collected, epoch_actions, epoch_obs):
+        """Feeds episodes from the rollout workers through the agent (reward
+        scaling, obs normalization, HER episode boundaries). Returns the
+        number of env steps stored.
+        """
+        nb_steps = 0
+        for obs0, actions, rewards, obs1 in collected:
+            for i in range(len(obs0)):
+                agent.store_transition(obs0[i], actions[i], rewards[i], obs1[i], False)
+            agent.reset()
+            epoch_actions.extend(actions)
+            epoch_obs.extend(obs0)
+            nb_steps += len(obs0)
+        return nb_steps
+
+    def sample_Q(self, step):
+        """Whether to evaluate the critic at this rollout step for the
+        rollout/Q_mean stat. q_sample_freq = N evaluates every N-th step;
+        0 never does, and Q is instead computed once per epoch over the
+        epoch's observations in one batched call (with end-of-epoch weights).
+        """
+        return self.q_sample_freq > 0 and step % self.q_sample_freq == 0
+
+    def vec_rollout(self, agent, env, obs, max_action, epoch_obs):
+        """Runs one horizon on every env of a VecMujocoEnv with batched policy
+        calls, then stores the transitions one episode at a time (HER buffers
+        keep a single open episode). Returns the next observations, a Rollout
+        of env 0 and per-episode/per-step statistics.
+        """
+        rollout = Rollout()
+        # the env writes each step's observations straight into this
+        observations = np.empty((self.horizon + 1,) + obs.shape)
+        observations[0] = obs
+        obs0, actions, rewards, obs1 = [], [], [], []
+        qs = []
+        for t_rollout in range(self.horizon):
+            action, q = agent.pi_batch(obs, apply_noise=True, compute_Q=self.sample_Q(t_rollout))
+            rollout.store_transition(env.get_state_data(0), action[0], None)
+            new_obs, r, done, infos = env.step(max_action * action, out=observations[t_rollout + 1])
+            rollout.rewards[-1] = r[0]
+
+            next_obs = new_obs
+            if done.any():
+                next_obs = new_obs.copy()
+                for i in np.flatnonzero(done):
+                    next_obs[i] = infos[i]["terminal_observation"]
+            obs0.append(obs)
+            actions.append(action)
+            rewards.append(r)
+            obs1.append(next_obs)
+            if q is not None:
+                qs.extend(q)
+            if self.q_sample_freq == 0:
+                epoch_obs.extend(obs)
+            obs = new_obs
+        final_state = infos[0].get("terminal_state") or env.get_state_data(0)
+        rollout.store_transition(final_state, None, None) # store final state
+
+        for i in range(self.nb_envs):
+            for t_rollout in range(self.horizon):
+                agent.store_transition(obs0[t_rollout][i], actions[t_rollout][i], rewards[t_rollout][i],
+                    obs1[t_rollout][i], t_rollout == self.horizon - 1)
+            agent.reset()
+
+        rewards = np.array(rewards)
+        episode_rewards = list(rewards.sum(axis=0))
+        episode_success = list(rewards[-1] + 1)
+        step_actions = list(np.concatenate(actions))
+        return obs, rollout, episode_rewards, episode_success, step_actions, qs
+
     # TODO: this should restore the state of a training. But for now it just pickles params
     def __getstate__(self):
         exclude_vars = set(["env"])
@@ -0,0 +1,182 @@
+"""Environment step throughput benchmarks.
+
+Measures steps per second per env class for a single env, VecMujocoEnv
+(one MjSimPool) at several pool sizes (only for VEC_ENVS), a pool of worker
+processes and MPI ranks. For the single env it also splits the cost of a step between physics
+(set_action and frame_skip sim.step calls), get_obs and get_reward; anything
+else env.step does (e.g. PushingEnv's reward, which it computes inside _step)
+shows up as "other". Results are written as JSON so runs can be compared.
+
+python ss/bench/envs.py results.json
+mpirun -np 4 python ss/bench/envs.py results_mpi.json # MPI section only
+"""
+
+import json
+import platform
+import time
+from multiprocessing import Pool
+
+import click
+import numpy as np
+from mpi4py import MPI
+
+from ss.envs.ball_env import BallEnv
+from ss.envs.box_env import BoxEnv
+from ss.envs.pushing_env import PushingEnv
+from ss.envs.fast_ball_env import FastBallEnv, VecFastBallEnv
+from ss.envs.vec_env import VecMujocoEnv
+
+ENV_TYPES = {
+    "ball": BallEnv,
+    "box": BoxEnv,
+    "pushing": PushingEnv,
+    "fast_ball": FastBallEnv,
+}
+
+# PushingEnv computes its reward and done in _step, which VecMujocoEnv skips
+VEC_ENVS = ["ball", "box", "fast_ball"]
+
+HORIZON = 50 # steps between resets; resets are not timed
+
+def random_actions(env, n):
+    low, high = env.action_space.low, env.action_space.high
+    return np.random.uniform(low, high, (n,) + env.action_space.shape)
+
+def run_steps(env, steps):
+    """Seconds spent in env.step over steps steps"""
+    actions = random_actions(env, HORIZON)
+    elapsed = 0.
+    for start in range(0, steps, HORIZON):
+        env.reset()
+        t0 = time.perf_counter()
+        for u in actions[:min(HORIZON, steps - start)]:
+            env.step(u)
+        elapsed += time.perf_counter() - t0
+    return elapsed
+
+def bench_single(env_name, steps):
+    env = ENV_TYPES[env_name]()
+    elapsed = run_steps(env, steps)
+    results = {"steps_per_s": steps / elapsed}
+
+    if hasattr(env, "sim"):
+        # time each part of MujocoEnv._step on its own
+        actions = random_actions(env, HORIZON)
+        split = {"physics": 0., "get_obs": 0., "get_reward": 0.}
+        for start in range(0, steps, HORIZON):
+            env.reset()
+            for u in actions[:min(HORIZON, steps - start)]:
+                t0 = time.perf_counter()
+                for _ in range(env.frame_skip):
+                    env.set_action(u)
+                    env.sim.step()
+                t1 = time.perf_counter()
+                obs = env.get_obs()
+                t2 = time.perf_counter()
+                env.get_reward(obs)
+                t3 = time.perf_counter()
+                split["physics"] += t1 - t0
+                split["get_obs"] += t2 - t1
+                split["get_reward"] += t3 - t2
+        split["other"] = max(0., elapsed - sum(split.values()))
+        results["us_per_step"] = {k: 1e6 * v / steps for k, v in split.items()}
+    env.close()
+    return results
+
+def make_vec_env(env_name, nb_envs):
+    if env_name == "fast_ball":
+        return VecFastBallEnv(nb_envs, HORIZON)
+    return VecMujocoEnv(ENV_TYPES[env_name], nb_envs, HORIZON)
+
+def bench_vec(env_name, pool_sizes, steps):
+    """Steps per second (counting every env) of VecMujocoEnv.step, and of the
+    bare MjSimPool.step for the physics share
+    """
+    results = {}
+    for nb_envs in pool_sizes:
+        vec_env = make_vec_env(env_name, nb_envs)
+        obs = vec_env.reset()
+        actions = random_actions(vec_env, nb_envs)
+        nb_steps = max(1, steps // nb_envs)
+        t0 = time.perf_counter()
+        for _ in range(nb_steps):
+            vec_env.step(actions, out=obs) # resets every HORIZON steps
+        result = {"steps_per_s": nb_steps * nb_envs / (time.perf_counter() - t0)}
+        if hasattr(vec_env, "pool"):
+            t0 = time.perf_counter()
+            for _ in range(nb_steps):
+                vec_env.pool.step()
+            result["physics_steps_per_s"] = nb_steps * nb_envs / (time.perf_counter() - t0)
+        results[str(nb_envs)] = result
+        vec_env.close()
+    return results
+
+def process_steps(args):
+    """Run in a worker process: steps single-env steps, timed inside"""
+    env_name, steps, seed = args
+    np.random.seed(seed)
+    env = ENV_TYPES[env_name]()
+    return run_steps(env, steps)
+
+def bench_processes(env_name, nb_workers_list, steps):
+    """Each of nb_workers processes steps its own env for steps / nb_workers
+    steps. Throughput counts the slowest worker's stepping time, so env
+    construction and process startup are excluded.
+    """
+    results = {}
+    for nb_workers in nb_workers_list:
+        pool = Pool(processes=nb_workers)
+        per_worker = max(1, steps // nb_workers)
+        elapsed = pool.map(process_steps, [(env_name, per_worker, i) for i in range(nb_workers)])
+        pool.close()
+        pool.join()
+        results[str(nb_workers)] = {"steps_per_s": per_worker * nb_workers / max(elapsed)}
+    return results
+
+def bench_mpi(env_name, steps, comm):
+    """Every rank steps its own env, as in an MPI training run"""
+    per_rank = max(1, steps // comm.Get_size())
+    np.random.seed(comm.Get_rank())
+    env = ENV_TYPES[env_name]()
+    comm.Barrier()
+    elapsed = comm.allreduce(run_steps(env, per_rank), op=MPI.MAX)
+    env.close()
+    return {"steps_per_s": per_rank * comm.Get_size() / elapsed}
+
+@click.command()
+@click.argument('output', default='env_bench.json')
+@click.option('--envs', default='ball,box,pushing,fast_ball', help='comma separated names from ENV_TYPES')
+@click.option('--steps', default=20000, help='total env steps per measurement')
+@click.option('--pool-sizes', default='1,2,4,8,16,32,64')
+@click.option('--workers', default='1,2,4,8')
+def main(output, envs, steps, pool_sizes, workers):
+    comm = MPI.COMM_WORLD
+    env_names = envs.split(',')
+    results = {
+        'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'host': platform.node(),
+        'numpy': np.__version__,
+        'steps': steps,
+        'horizon': HORIZON,
+    }
+    if comm.Get_size() > 1:
+        results['mpi_size'] = comm.Get_size()
+        results['mpi'] = {name: bench_mpi(name, steps, comm) for name in env_names}
+    else:
+        pool_sizes = [int(n) for n in pool_sizes.split(',')]
+        workers = [int(n) for n in workers.split(',')]
+        for name in env_names:
+            results[name] = {
+                'single': bench_single(name, steps),
+                'processes': bench_processes(name, workers, steps),
+            }
+            if name in VEC_ENVS:
+                results[name]['vec'] = bench_vec(name, pool_sizes, steps)
+
+    if comm.Get_rank() == 0:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
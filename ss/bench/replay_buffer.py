@@ -0,0 +1,168 @@
+"""Microbenchmarks for the replay buffers.
+
+Times insertion throughput, sample latency, HER flush cost per episode
+length and peak RSS per buffer size for RingBuffer, ReplayBuffer (split,
+packed, prioritized), HERBuffer, EpisodeHERBuffer and baselines' Memory,
+and writes the results as JSON so runs can be compared over time.
+
+python ss/bench/replay_buffer.py results.json
+"""
+
+import json
+import platform
+import resource
+import time
+from multiprocessing import Pool
+
+import click
+import numpy as np
+
+from baselines.ddpg.memory import Memory
+from ss.algos.replay_buffer import RingBuffer, ReplayBuffer, HERBuffer, EpisodeHERBuffer
+from ss.envs.ball_rewards import obs_to_goal, get_sparse_reward
+
+OBSERVATION_SHAPE = (5,) # BallEnv layout, so the HER reward functions apply
+ACTION_SHAPE = (2,)
+GOAL_IDX = slice(3, 5)
+
+def make_buffer(kind, limit, horizon=50):
+    if kind == "memory":
+        return Memory(limit=limit, action_shape=ACTION_SHAPE, observation_shape=OBSERVATION_SHAPE)
+    if kind == "replay":
+        return ReplayBuffer(limit, ACTION_SHAPE, OBSERVATION_SHAPE)
+    if kind == "replay_packed":
+        return ReplayBuffer(limit, ACTION_SHAPE, OBSERVATION_SHAPE, packed=True)
+    if kind == "replay_prioritized":
+        return ReplayBuffer(limit, ACTION_SHAPE, OBSERVATION_SHAPE, prioritized=True)
+    if kind == "her":
+        return HERBuffer(limit, ACTION_SHAPE, OBSERVATION_SHAPE, obs_to_goal, GOAL_IDX, get_sparse_reward)
+    if kind == "her_future":
+        return EpisodeHERBuffer(limit, ACTION_SHAPE, OBSERVATION_SHAPE, obs_to_goal, GOAL_IDX, get_sparse_reward,
+            episode_length=horizon, strategy="future")
+    raise ValueError("unknown buffer kind %s" % kind)
+
+BUFFER_KINDS = ["memory", "replay", "replay_packed", "replay_prioritized", "her", "her_future"]
+
+def random_episode(horizon):
+    obs = np.random.uniform(-0.3, 0.3, (horizon + 1,) + OBSERVATION_SHAPE)
+    actions = np.random.uniform(-1, 1, (horizon,) + ACTION_SHAPE)
+    rewards = get_sparse_reward(obs[1:])
+    return obs[:-1], actions, rewards, obs[1:]
+
+def fill(memory, n, horizon=50):
+    """Insert n transitions episode by episode"""
+    for _ in range(max(1, n // horizon)):
+        for transition in zip(*random_episode(horizon)):
+            memory.append(*transition, False)
+        if hasattr(memory, 'flush'):
+            memory.flush()
+
+def timeit(fn, repeats):
+    """Best-of-three seconds per call of fn"""
+    best = np.inf
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeats)
+    return best
+
+def bench_insertion(limit, n):
+    results = {}
+    rows = np.random.uniform(size=(n,) + OBSERVATION_SHAPE).astype('float32')
+
+    def ring_append():
+        ring = RingBuffer(limit, OBSERVATION_SHAPE)
+        for row in rows:
+            ring.append(row)
+    def ring_extend():
+        RingBuffer(limit, OBSERVATION_SHAPE).extend(rows)
+    results["ring_append"] = n / timeit(ring_append, 1)
+    results["ring_extend"] = n / timeit(ring_extend, 1)
+
+    obs0, actions, rewards, obs1 = random_episode(n)
+    for kind in ["memory", "replay", "replay_packed", "replay_prioritized"]:
+        def append():
+            memory = make_buffer(kind, limit)
+            for i in range(n):
+                memory.append(obs0[i], actions[i], rewards[i], obs1[i], False)
+        results[kind + "_append"] = n / timeit(append, 1)
+        if kind != "memory":
+            def extend():
+                make_buffer(kind, limit).extend(obs0, actions, rewards, obs1)
+            results[kind + "_extend"] = n / timeit(extend, 1)
+    return results # rows per second
+
+def bench_sample(limit, batch_sizes, repeats):
+    results = {}
+    for kind in BUFFER_KINDS:
+        memory = make_buffer(kind, limit)
+        fill(memory, limit)
+        results[kind] = {str(b): timeit(lambda: memory.sample(batch_size=b), repeats) for b in batch_sizes}
+    return results # seconds per sample call
+
+def bench_flush(limit, horizons, repeats):
+    results = {}
+    for kind in ["her", "her_future"]:
+        results[kind] = {}
+        for horizon in horizons:
+            memory = make_buffer(kind, limit, horizon=horizon)
+            episode = list(zip(*random_episode(horizon)))
+            def flush():
+                for transition in episode:
+                    memory.append(*transition, False)
+                memory.flush()
+            results[kind][str(horizon)] = timeit(flush, repeats)
+    return results # seconds per episode, including the appends
+
+def peak_rss(args):
+    """Run in a fresh process: build and fill one buffer, report ru_maxrss"""
+    kind, limit = args
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    memory = make_buffer(kind, limit)
+    if hasattr(memory, 'extend'):
+        obs0, actions, rewards, obs1 = random_episode(min(limit, 100000))
+        for _ in range(max(1, limit // len(obs0))):
+            memory.extend(obs0, actions, rewards, obs1)
+    elif hasattr(memory, 'rings'):
+        # touch every page, as a full buffer would
+        for ring in memory.rings().values():
+            ring.data[...] = 1
+    else:
+        # Memory allocates through astype, which already touches every page
+        fill(memory, min(limit, 100000))
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'baseline_kb': before, 'peak_kb': after} # kilobytes on Linux
+
+def bench_rss(kinds, limits):
+    results = {}
+    pool = Pool(processes=1, maxtasksperchild=1)
+    for kind in kinds:
+        results[kind] = {str(limit): pool.apply(peak_rss, ((kind, limit),)) for limit in limits}
+    pool.close()
+    return results
+
+@click.command()
+@click.argument('output', default='replay_buffer_bench.json')
+@click.option('--limit', default=100000, help='buffer size for insertion/sample/flush')
+@click.option('--repeats', default=100)
+@click.option('--max-rss-size', default=int(1e7), help='largest buffer size for the RSS sweep')
+def main(output, limit, repeats, max_rss_size):
+    results = {
+        'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'host': platform.node(),
+        'numpy': np.__version__,
+        'limit': limit,
+    }
+    results['insertion_rows_per_s'] = bench_insertion(limit, min(limit, 10000))
+    results['sample_s'] = bench_sample(limit, [32, 128, 512, 1024, 4096], repeats)
+    results['flush_s'] = bench_flush(limit, [10, 20, 50, 100, 200], repeats)
+    rss_limits = [l for l in [int(1e4), int(1e5), int(1e6), int(1e7)] if l <= max_rss_size]
+    results['rss'] = bench_rss(BUFFER_KINDS, rss_limits)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
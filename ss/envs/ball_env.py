@@ -5,33 +5,16 @@ from gym import spaces
 import ss.path as path
 from mujoco_py.generated import const
 import scipy.misc
-
-def obs_to_goal(obs):
-    """State to goal function for HER.
-    To pickle the function it has to be defined like this.
-    """
-    return obs[1:3]
-
-def get_l2_reward(obs):
-    ball_pos = obs[1:3]
-    goal_pos = obs[3:5]
-    r = -np.linalg.norm(ball_pos - goal_pos)
-    return r
-
-def get_sparse_reward(obs):
-    """-1 if far, 0 if close"""
-    ball_pos = obs[1:3]
-    goal_pos = obs[3:5]
-    r = np.linalg.norm(ball_pos - goal_pos) < 0.1
-    return (r - 1).astype(float)
+from ss.envs.ball_rewards import obs_to_goal, get_l2_reward, get_sparse_reward
 
 class BallEnv(MujocoEnv):
-    def __init__(self, contained=True, reward_type="sparse"):
+    def __init__(self, contained=True, reward_type="sparse", frame_skip=1):
         self.ball_pos = np.zeros((2))
         self.goal_pos = np.zeros((2))
 
         self.obs_to_goal = obs_to_goal
         self.goal_idx = slice(3, 5)
+        self.obs_qpos_idx = np.arange(4) # ball_{x, y}, goal_{x, y}, after t
         self.reward_fn = {"sparse": get_sparse_reward,
                            "l2": get_l2_reward}[reward_type]
 
@@ -45,7 +28,7 @@ class BallEnv(MujocoEnv):
             mjfile = "models/ball_env_contained.xml"
         else:
             mjfile = "models/ball_env.xml"
-        MujocoEnv.__init__(self, mjfile)
+        MujocoEnv.__init__(self, mjfile, frame_skip)
         self.reset()
 
     def reset(self):
@@ -59,11 +42,12 @@ class BallEnv(MujocoEnv):
         ob = self.get_obs()
         return ob
 
-    def get_obs(self):
-        o = np.zeros((5))
-        o[0] = self.t
-        o[1:] = self.sim.data.qpos[:4].copy()
-        return o
+    def get_obs(self, out=None):
+        if out is None:
+            out = np.empty((5))
+        out[0] = self.t
+        self.get_qpos(self.obs_qpos_idx, out[1:])
+        return out
 
     def set_action(self, u):
         self.sim.data.qvel[:2] = u.copy()
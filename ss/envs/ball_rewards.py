@@ -0,0 +1,24 @@
+"""Goal and reward functions of the ball task, shared by BallEnv and
+FastBallEnv. Kept free of MuJoCo imports so FastBallEnv runs without it.
+"""
+
+import numpy as np
+
+def obs_to_goal(obs):
+    """State to goal function for HER.
+    To pickle the function it has to be defined like this.
+    """
+    return obs[..., 1:3]
+
+def get_l2_reward(obs):
+    ball_pos = obs[..., 1:3]
+    goal_pos = obs[..., 3:5]
+    r = -np.linalg.norm(ball_pos - goal_pos, axis=-1)
+    return r
+
+def get_sparse_reward(obs):
+    """-1 if far, 0 if close"""
+    ball_pos = obs[..., 1:3]
+    goal_pos = obs[..., 3:5]
+    r = np.linalg.norm(ball_pos - goal_pos, axis=-1) < 0.1
+    return (r - 1).astype(float)
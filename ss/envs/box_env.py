@@ -4,37 +4,42 @@ import numpy as np
 from gym import spaces
 import ss.path as path
 from mujoco_py.generated import const
+from ss.envs.reset_cache import get_reset_cache
 import scipy.misc
 
 def obs_to_goal(obs):
     """State to goal function for HER.
     To pickle the function it has to be defined like this.
     """
-    return obs[2:4]
+    return obs[..., 2:4]
 
 def get_l2_reward(obs):
-    ball_pos = obs[1:3]
-    goal_pos = obs[3:5]
-    r = -np.linalg.norm(ball_pos - goal_pos)
+    block_pos = obs[..., 2:4]
+    goal_pos = obs[..., 4:6]
+    r = -np.linalg.norm(block_pos - goal_pos, axis=-1)
     return r
 
 def get_sparse_reward(obs):
     """-1 if far, 0 if close"""
-    block_pos = obs[2:4]
-    goal_pos = obs[4:6]
-    r = np.linalg.norm(block_pos - goal_pos) < 0.1
+    block_pos = obs[..., 2:4]
+    goal_pos = obs[..., 4:6]
+    r = np.linalg.norm(block_pos - goal_pos, axis=-1) < 0.1
     # print(block_pos)
     # print(goal_pos)
     return (r - 1).astype(float)
 
 class BoxEnv(MujocoEnv):
-    def __init__(self, reward_type="sparse"):
+    def __init__(self, reward_type="sparse", reset_cache=None, reset_cache_size=10000, frame_skip=1):
+        """reset_cache: .npz file of settled initial states to reset from
+        (built with reset_cache_size states if it does not exist yet)
+        """
         self.ball_pos = np.zeros((2))
         self.block_pos = np.zeros((2))
         self.goal_pos = np.zeros((2))
 
         self.obs_to_goal = obs_to_goal
         self.goal_idx = slice(4, 6)
+        self.obs_qpos_idx = np.array([0, 1, 2, 3, 9, 10]) # ball_{x, y}, block_{x, y}, marker_{x, y}
         self.reward_fn = {"sparse": get_sparse_reward,
                            "l2": get_l2_reward}[reward_type]
 
@@ -45,7 +50,9 @@ class BoxEnv(MujocoEnv):
         self.observation_space = spaces.Box(-o_range, o_range)
 
         mjfile = "models/pushing2d_controller_goal.xml"
-        MujocoEnv.__init__(self, mjfile)
+        MujocoEnv.__init__(self, mjfile, frame_skip)
+        if reset_cache:
+            self.reset_cache = get_reset_cache(self, reset_cache, reset_cache_size)
         self.reset()
 
         # qpos (11):
@@ -60,17 +67,21 @@ class BoxEnv(MujocoEnv):
     def get_reward(self, obs):
         return self.reward_fn(obs)
 
-    def get_obs(self):
-        o = np.zeros((6))
-        o[:4] = self.sim.data.qpos[:4].copy()
-        o[4:] = self.sim.data.qpos[9:11].copy()
-        return o
+    def get_obs(self, out=None):
+        if out is None:
+            out = np.empty((6))
+        return self.get_qpos(self.obs_qpos_idx, out)
 
     def set_view(self, cam_id):
         self.viewer.cam.fixedcamid = cam_id
         self.viewer.cam.type = const.CAMERA_FIXED
 
     def reset(self):
+        if self.reset_cache is not None:
+            return self.reset_from_cache()
+        return self.settled_reset()
+
+    def settled_reset(self):
         interior = 0.35
         while True:
             ball_pos = np.random.random((2)) * 2 * interior - interior
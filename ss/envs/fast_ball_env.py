@@ -0,0 +1,181 @@
+"""Pure NumPy stand-in for BallEnv.
+
+BallEnv sets the ball velocity to the action before every physics step and
+lets MuJoCo integrate a damped point mass (models/ball_env*.xml: mass 5,
+joint damping 1, timestep 0.01, Euler integrator, implicit in damping). Over
+one physics step the velocity decays by m / (m + h * b) and the position
+moves by h times the new velocity, so an agent step of frame_skip physics
+steps moves the ball by step_scale * u. In the contained model the walls
+stop the ball's capsule at BALL_RANGE; MuJoCo's soft contacts let it sink in
+slightly, so trajectories only match up to a few millimeters once the ball
+reaches a wall.
+
+Observations, goal_idx, obs_to_goal and the reward functions are BallEnv's,
+and states are (qpos, qvel) in BallEnv's layout, so rollouts can still be
+replayed in MuJoCo.
+"""
+
+import gym
+from gym import spaces
+from gym.utils import seeding
+import numpy as np
+import pdb
+
+from ss.envs.ball_rewards import obs_to_goal, get_l2_reward, get_sparse_reward
+
+TIMESTEP = 0.01
+MASS = 5.
+DAMPING = 1.
+BALL_RANGE = np.array([0.43, 0.44]) # inner wall face 0.49 minus capsule half extents (0.06, 0.05)
+
+def get_step_scale(frame_skip):
+    """Ball displacement per unit action over frame_skip physics steps"""
+    decay = MASS / (MASS + TIMESTEP * DAMPING)
+    return frame_skip * TIMESTEP * decay
+
+class VecFastBallEnv(object):
+    """nb_envs balls integrated together, with VecMujocoEnv's interface:
+    batched reset/step (optionally into out), automatic reset after horizon
+    steps with info["terminal_observation"] and info["terminal_state"].
+    """
+    def __init__(self, nb_envs, horizon, contained=True, reward_type="sparse", frame_skip=1):
+        self.nb_envs = nb_envs
+        self.horizon = horizon
+        self.contained = contained
+        self.frame_skip = frame_skip
+        self.step_scale = get_step_scale(frame_skip)
+        self.decay = MASS / (MASS + TIMESTEP * DAMPING)
+
+        self.obs_to_goal = obs_to_goal
+        self.goal_idx = slice(3, 5)
+        self.reward_fn = {"sparse": get_sparse_reward,
+                           "l2": get_l2_reward}[reward_type]
+
+        u_range = np.ones((2))
+        self.action_space = spaces.Box(-u_range, u_range)
+
+        o_range = np.ones((5))
+        self.observation_space = spaces.Box(-o_range, o_range)
+
+        self.t = np.zeros(nb_envs, dtype='int64')
+        self.ball_pos = np.zeros((nb_envs, 2))
+        self.ball_vel = np.zeros((nb_envs, 2))
+        self.goal_pos = np.zeros((nb_envs, 2))
+
+    def seed(self, seed=None):
+        # like BallEnv, resets draw from the global np.random
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def reset_envs(self, idxs):
+        """Same draws as BallEnv.reset, for all envs in idxs at once"""
+        n = len(idxs)
+        interior = 0.3
+        self.t[idxs] = 0
+        self.ball_pos[idxs] = np.random.random((n, 2)) * 2 * interior - interior
+        self.goal_pos[idxs] = np.random.random((n, 2)) * 2 * interior - interior
+        self.ball_vel[idxs] = 0
+
+    def reset(self, out=None):
+        self.reset_envs(np.arange(self.nb_envs))
+        return self.get_obs(out)
+
+    def get_obs(self, out=None):
+        if out is None:
+            out = np.empty((self.nb_envs, 5))
+        out[:, 0] = self.t
+        out[:, 1:3] = self.ball_pos
+        out[:, 3:5] = self.goal_pos
+        return out
+
+    def step(self, actions, out=None):
+        assert len(actions) == self.nb_envs
+        self.ball_pos += self.step_scale * actions
+        self.ball_vel[:] = self.decay * actions
+        if self.contained:
+            blocked = np.abs(self.ball_pos) > BALL_RANGE
+            np.clip(self.ball_pos, -BALL_RANGE, BALL_RANGE, out=self.ball_pos)
+            self.ball_vel[blocked] = 0
+        self.t += 1
+
+        obs = self.get_obs(out)
+        rewards = self.reward_fn(obs)
+        dones = self.t >= self.horizon
+        infos = [{} for _ in range(self.nb_envs)]
+        if dones.any():
+            idxs = np.flatnonzero(dones)
+            for i in idxs:
+                infos[i]["terminal_observation"] = obs[i].copy()
+                infos[i]["terminal_state"] = self.get_state_data(i)
+            self.reset_envs(idxs)
+            obs[idxs] = self.get_obs()[idxs]
+        return obs, rewards, dones, infos
+
+    def set_state(self, i, qpos, qvel):
+        self.ball_pos[i] = qpos[:2]
+        self.goal_pos[i] = qpos[2:4]
+        self.ball_vel[i] = qvel[:2]
+
+    def get_state_data(self, i=None):
+        """(qpos, qvel) of env i in BallEnv's layout, or a list for all envs"""
+        if i is None:
+            return [self.get_state_data(i) for i in range(self.nb_envs)]
+        qpos = np.concatenate([self.ball_pos[i], self.goal_pos[i]])
+        qvel = np.concatenate([self.ball_vel[i], np.zeros(2)])
+        return qpos, qvel
+
+    def render(self, i=0):
+        pass
+
+    def close(self):
+        pass
+
+class FastBallEnv(gym.Env):
+    """Drop-in for BallEnv (same constructor arguments) backed by a
+    VecFastBallEnv of one env. With nb_envs > 1 main.run builds
+    vec_env_type instead of a VecMujocoEnv.
+    """
+    vec_env_type = VecFastBallEnv
+
+    def __init__(self, contained=True, reward_type="sparse", frame_skip=1):
+        self.vec_env = VecFastBallEnv(1, np.inf, contained, reward_type, frame_skip)
+        self.obs_to_goal = self.vec_env.obs_to_goal
+        self.goal_idx = self.vec_env.goal_idx
+        self.reward_fn = self.vec_env.reward_fn
+        self.action_space = self.vec_env.action_space
+        self.observation_space = self.vec_env.observation_space
+        self._seed()
+        self.reset()
+
+    def _seed(self, seed=None):
+        return self.vec_env.seed(seed)
+
+    @property
+    def t(self):
+        return self.vec_env.t[0]
+
+    def reset(self):
+        return self.vec_env.reset()[0]
+
+    def _step(self, u):
+        obs, rewards, dones, infos = self.vec_env.step(np.reshape(u, (1, 2)))
+        return obs[0], rewards[0], False, {"diverged": False}
+
+    def get_obs(self, out=None):
+        obs = self.vec_env.get_obs()[0]
+        if out is not None:
+            out[:] = obs
+            return out
+        return obs
+
+    def get_reward(self, obs):
+        return self.reward_fn(obs)
+
+    def set_state(self, qpos, qvel):
+        self.vec_env.set_state(0, qpos, qvel)
+
+    def get_state_data(self):
+        return self.vec_env.get_state_data(0)
+
+    def _render(self, mode='human', close=False):
+        pass
@@ -24,6 +24,8 @@ class MujocoEnv(gym.Env):
         self.viewer = None
         self.mjviewer = mjviewer
         self.t = 0
+        self.reset_cache = None
+        self.forward_stale = False # positions (xpos, sites) lag the last sim.step
 
         self.metadata = {
             'render.modes': ['human', 'rgb_array'],
@@ -58,14 +60,15 @@ class MujocoEnv(gym.Env):
     # methods to override:
     # ----------------------------
 
-    def get_obs(self):
-        return np.concatenate([
-            self.sim.data.qpos.flat,
-            self.sim.data.qvel.flat
-        ])
+    def get_obs(self, out=None):
+        """Writes into out (e.g. a row of a preallocated batch) when given,
+        otherwise into a new array
+        """
+        return self.state_vector(out)
 
     def get_reward(self, obs):
-        return 0.0
+        """obs may be one observation or an (N, obs_dim) batch"""
+        return np.zeros(np.shape(obs)[:-1])
 
     def set_action(self, u):
         self.sim.data.ctrl[:] = u
@@ -81,17 +84,40 @@ class MujocoEnv(gym.Env):
 
     # -----------------------------
 
+    def reset_from_cache(self):
+        """Start the episode from a settled state drawn from self.reset_cache"""
+        self.t = 0
+        qpos, qvel = self.reset_cache.sample()
+        self.set_state(qpos, qvel)
+        return self.get_obs()
+
     def set_state(self, qpos, qvel):
         assert qpos.shape == (self.model.nq,) and qvel.shape == (self.model.nv,)
         self.data = self.sim.data
         self.data.qpos[:] = qpos
         self.data.qvel[:] = qvel
         self.sim.forward()
+        self.forward_stale = False
+
+    def forward(self):
+        """Recompute positions derived from qpos (xpos, site positions, what
+        render shows) if a step left them stale
+        """
+        if self.forward_stale:
+            self.sim.forward()
+            self.forward_stale = False
 
     def _step(self, u):
-        self.set_action(u)
-        self.sim.step()
-        self.sim.forward()
+        """Holds u for frame_skip physics steps (set_action is re-applied on
+        every substep, since envs that set qvel would otherwise see it decay).
+        obs/reward are computed once, after the last substep. Observations only
+        read qpos, which sim.step leaves current, so the forward pass that
+        updates derived positions is deferred to forward().
+        """
+        for _ in range(self.frame_skip):
+            self.set_action(u)
+            self.sim.step()
+        self.forward_stale = True
         self.t += 1
 
         obs = self.get_obs()
@@ -108,6 +134,7 @@ class MujocoEnv(gym.Env):
         self.sim.data.ctrl = ctrl
         for _ in range(n_frames):
             self.sim.step()
+        self.forward_stale = True
 
     def _render(self, mode='human', close=False):
         if close:
@@ -115,11 +142,13 @@ class MujocoEnv(gym.Env):
                 # self._get_viewer().finish()
                 self.viewer = None
             return
+        self.forward()
         self._get_viewer().render()
         # if mode == 'rgb_array':
         #     # self._get_viewer().render()
 
     def get_img(self, width=480, height=480):
+        self.forward()
         return self.sim.render(width, height, camera_name="maincam")
 
     def set_view(self, cam_id):
@@ -144,13 +173,27 @@ class MujocoEnv(gym.Env):
         return self.model.data.xmat[idx].reshape((3, 3))
 
     def get_site_pos(self, site_name):
+        self.forward()
         return self.data.get_site_xpos(site_name)  # returns 1D array with shape(3,)
 
-    def state_vector(self):
-        return np.concatenate([
-            self.sim.data.qpos.flat,
-            self.sim.data.qvel.flat
-        ])
-
-    def get_state_data(self):
-        return self.sim.data.qpos.flat[:], self.sim.data.qvel.flat[:]
+    def get_qpos(self, idxs, out):
+        """qpos[idxs], written into out"""
+        # mode="clip" lets take write into out without an intermediate buffer
+        return np.take(self.sim.data.qpos, idxs, out=out, mode="clip")
+
+    def state_vector(self, out=None):
+        nq = self.model.nq
+        if out is None:
+            out = np.empty(nq + self.model.nv)
+        out[:nq] = self.sim.data.qpos
+        out[nq:] = self.sim.data.qvel
+        return out
+
+    def get_state_data(self, out=None):
+        """Copies of (qpos, qvel), or written into the arrays of out"""
+        if out is None:
+            return self.sim.data.qpos.copy(), self.sim.data.qvel.copy()
+        qpos, qvel = out
+        qpos[:] = self.sim.data.qpos
+        qvel[:] = self.sim.data.qvel
+        return out
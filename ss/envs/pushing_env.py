@@ -3,20 +3,21 @@ import pdb
 import numpy as np
 from gym import spaces
 from mujoco_py.generated import const
+from ss.envs.reset_cache import get_reset_cache
 import time
 
 class PushingEnv(MujocoEnv):
-    def __init__(self):
+    def __init__(self, reset_cache=None, reset_cache_size=10000):
         MujocoEnv.__init__(self, "models/pushing2d_controller_goal.xml", 3)
+        if reset_cache:
+            self.reset_cache = get_reset_cache(self, reset_cache, reset_cache_size)
 
     def _set_action(self, action):
         self.sim.data.ctrl[:] = action
 
-    def get_obs(self):
-        return np.concatenate([
-                self.sim.data.qpos.ravel().copy(),
-                self.sim.data.qvel.ravel().copy()
-        ])
+    def get_obs(self, out=None):
+        """qpos and qvel, written into out when given"""
+        return self.state_vector(out)
 
     def _step(self, action):
         self.do_simulation(action, self.frame_skip)
@@ -24,7 +25,7 @@ class PushingEnv(MujocoEnv):
         reward_dist = np.linalg.norm(ref_point)
         reward_ctrl = -np.linalg.norm(action)
         reward = reward_dist + reward_ctrl
-        ob = self._get_obs()
+        ob = self.get_obs()
         done = np.linalg.norm(ref_point) <= 5e-3
         return ob, reward, done, dict(reward_dist=reward_dist, reward_ctrl=reward_ctrl)
 
@@ -34,6 +35,11 @@ class PushingEnv(MujocoEnv):
         self.viewer.cam.type = const.CAMERA_FIXED
 
     def reset(self):
+        if self.reset_cache is not None:
+            return self.reset_from_cache()
+        return self.settled_reset()
+
+    def settled_reset(self):
         self.t = 0
         # randomize the position and pose of the L shaped block
         angle = np.random.uniform(1./4.1, 1./3.9)*np.pi
@@ -52,7 +58,7 @@ class PushingEnv(MujocoEnv):
         self.set_state(qpos, qvel)
         for i in range(10): # scene settling time
             self.sim.step()
-        ob = self._get_obs()
+        ob = self.get_obs()
         self. t= 0
         return ob
 
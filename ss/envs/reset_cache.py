@@ -0,0 +1,81 @@
+"""Pool of settled initial states for envs whose reset is expensive
+(rejection sampling plus settle steps, e.g. BoxEnv and PushingEnv).
+
+python ss/envs/reset_cache.py BoxEnv data/boxenv_resets.npz 10000
+"""
+
+import fcntl
+import os
+import click
+import numpy as np
+
+class ResetCache(object):
+    def __init__(self, qpos, qvel):
+        self.qpos = qpos
+        self.qvel = qvel
+
+    def __len__(self):
+        return len(self.qpos)
+
+    @classmethod
+    def build(cls, env, size):
+        """Run the env's full settled_reset size times and keep the states"""
+        qpos = np.zeros((size, env.model.nq))
+        qvel = np.zeros((size, env.model.nv))
+        for i in range(size):
+            env.settled_reset()
+            qpos[i] = env.sim.data.qpos
+            qvel[i] = env.sim.data.qvel
+        return cls(qpos, qvel)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        return cls(data["qpos"], data["qvel"])
+
+    def save(self, filename):
+        """Write to a temporary file and rename it into place, so readers
+        never see a partial archive
+        """
+        tmp = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tmp, "wb") as f: # a file object keeps savez from adding .npz
+            np.savez(f, qpos=self.qpos, qvel=self.qvel)
+        os.rename(tmp, filename)
+
+    def sample(self):
+        i = np.random.randint(len(self))
+        return self.qpos[i], self.qvel[i]
+
+def cache_filename(filename):
+    if not filename.endswith(".npz"):
+        filename += ".npz"
+    return filename
+
+def get_reset_cache(env, filename, size):
+    """Load the cache in filename, or build it for env and save it there.
+    A lock file makes sure only one process (MPI rank, rollout worker or
+    sub-env) builds it while the others wait and then load it.
+    """
+    filename = cache_filename(filename)
+    with open(filename + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(filename):
+            cache = ResetCache.load(filename)
+            assert cache.qpos.shape[1] == env.model.nq and cache.qvel.shape[1] == env.model.nv
+            return cache
+        cache = ResetCache.build(env, size)
+        cache.save(filename)
+        return cache
+
+@click.command()
+@click.argument("env_name")
+@click.argument("filename")
+@click.argument("size", default=10000)
+def main(env_name, filename, size):
+    from ss.envs.box_env import BoxEnv
+    from ss.envs.pushing_env import PushingEnv
+    env = {"BoxEnv": BoxEnv, "PushingEnv": PushingEnv}[env_name]()
+    ResetCache.build(env, size).save(cache_filename(filename))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""Helpers for goal/reward functions, independent of the simulator"""
+
+import numpy as np
+
+def check_batched_reward(reward_fn, observations):
+    """Reward functions must accept either one observation or an
+    (N, obs_dim) batch (returning N rewards). Asserts both paths agree.
+    """
+    observations = np.asarray(observations)
+    batched = np.asarray(reward_fn(observations))
+    assert batched.shape == observations.shape[:1], \
+        "reward_fn returned shape %s for a batch of %d" % (batched.shape, len(observations))
+    single = np.array([reward_fn(o) for o in observations])
+    assert np.allclose(batched, single), "batched and per-observation rewards differ"
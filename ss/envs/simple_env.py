@@ -39,8 +39,8 @@ class BallEnv(MujocoEnv):
 
     def get_reward(self, obs):
         # return np.linalg.norm(self.ball_pos - self.goal_pos) < 0.05
-        ball_pos = obs[:2]
-        r = -np.linalg.norm(ball_pos - self.goal_pos)
+        ball_pos = obs[..., :2]
+        r = -np.linalg.norm(ball_pos - self.goal_pos, axis=-1)
         # print(r)
         return r
 
@@ -0,0 +1,88 @@
+import mujoco_py
+import numpy as np
+import pdb
+
+from ss.envs.mujoco_env import MujocoEnv
+
+class VecMujocoEnv(object):
+    """N copies of a MujocoEnv stepped together through one MjSimPool.
+    reset/step take and return batches: (N, obs_dim) observations,
+    (N, action_dim) actions and (N,) rewards/dones. Each env is reset
+    automatically once it has run for horizon steps; its last observation
+    is then returned in info["terminal_observation"] (and its simulator state
+    in info["terminal_state"]). Each step runs frame_skip pool steps,
+    re-applying the actions before each one, as MujocoEnv._step does.
+
+    reset/step write observations into out when it is given (an (N, obs_dim)
+    float array, e.g. a slice of trajectory storage) instead of a new array.
+
+    step only runs get_obs and a batched get_reward, so env types whose _step
+    does more (e.g. PushingEnv's reward and done) are not supported.
+    """
+
+    def __init__(self, env_type, nb_envs, horizon, **env_kwargs):
+        assert env_type._step is MujocoEnv._step, \
+            "%s overrides _step, which VecMujocoEnv.step would skip" % env_type.__name__
+        self.envs = [env_type(**env_kwargs) for _ in range(nb_envs)]
+        self.pool = mujoco_py.MjSimPool([env.sim for env in self.envs])
+        self.frame_skip = self.envs[0].frame_skip
+        self.nb_envs = nb_envs
+        self.horizon = horizon
+
+        env = self.envs[0]
+        self.action_space = env.action_space
+        self.observation_space = env.observation_space
+        self.obs_to_goal = getattr(env, "obs_to_goal", None)
+        self.goal_idx = getattr(env, "goal_idx", None)
+        self.reward_fn = getattr(env, "reward_fn", None)
+
+    def seed(self, seed=None):
+        for i, env in enumerate(self.envs):
+            env.seed(None if seed is None else seed + i)
+
+    def reset(self, out=None):
+        if out is None:
+            out = np.empty((self.nb_envs,) + self.observation_space.shape)
+        for env, row in zip(self.envs, out):
+            row[:] = env.reset()
+        return out
+
+    def step(self, actions, out=None):
+        assert len(actions) == self.nb_envs
+        for _ in range(self.frame_skip):
+            for env, u in zip(self.envs, actions):
+                env.set_action(u)
+            self.pool.step()
+        for env in self.envs:
+            env.forward_stale = True
+            env.t += 1
+
+        obs = out
+        if obs is None:
+            obs = np.empty((self.nb_envs,) + self.observation_space.shape)
+        for env, row in zip(self.envs, obs):
+            env.get_obs(out=row)
+        # get_reward takes a batch of observations (see check_batched_reward)
+        rewards = self.envs[0].get_reward(obs)
+        dones = np.zeros(self.nb_envs, dtype=bool)
+        infos = [{} for _ in range(self.nb_envs)]
+        for i, env in enumerate(self.envs):
+            if env.t >= self.horizon:
+                dones[i] = True
+                infos[i]["terminal_observation"] = obs[i].copy()
+                infos[i]["terminal_state"] = env.get_state_data()
+                obs[i] = env.reset()
+        return obs, rewards, dones, infos
+
+    def get_state_data(self, i=None):
+        """State of env i, or a list for all envs"""
+        if i is None:
+            return [env.get_state_data() for env in self.envs]
+        return self.envs[i].get_state_data()
+
+    def render(self, i=0):
+        self.envs[i].render()
+
+    def close(self):
+        for env in self.envs:
+            env.close()
@@ -0,0 +1,48 @@
+from ss.envs.ball_env import BallEnv
+from ss.envs.fast_ball_env import FastBallEnv, VecFastBallEnv
+import numpy as np
+import time
+
+EPISODES = 100
+HORIZON = 50
+FREE_TOL = 1e-6 # away from the walls the dynamics are the same up to rounding
+WALL_TOL = 0.01 # MuJoCo's soft contacts let the ball sink into the wall a little
+
+for contained in [True, False]:
+    for frame_skip in [1, 5]:
+        env = BallEnv(contained=contained, frame_skip=frame_skip)
+        fast_env = FastBallEnv(contained=contained, frame_skip=frame_skip)
+        max_error = {"free": 0., "wall": 0.}
+        for episode in range(EPISODES):
+            np.random.seed(episode)
+            obs = env.reset()
+            np.random.seed(episode)
+            fast_obs = fast_env.reset()
+            assert np.array_equal(obs, fast_obs)
+            for t in range(HORIZON):
+                u = np.random.uniform(-1, 1, 2)
+                obs, r, _, _ = env.step(u)
+                fast_obs, fast_r, _, _ = fast_env.step(u)
+                error = np.abs(obs - fast_obs).max()
+                at_wall = contained and np.any(np.abs(fast_obs[1:3]) >= 0.43 - 0.01)
+                key = "wall" if at_wall else "free"
+                max_error[key] = max(max_error[key], error)
+                # the sparse reward may flip right at the goal radius
+                assert r == fast_r or abs(np.linalg.norm(obs[1:3] - obs[3:5]) - 0.1) < WALL_TOL
+                if at_wall:
+                    # resync so errors at the wall do not carry over
+                    fast_env.set_state(*env.get_state_data())
+        print("contained", contained, "frame_skip", frame_skip, "max error", max_error)
+        assert max_error["free"] < FREE_TOL
+        assert max_error["wall"] < WALL_TOL
+
+for nb_envs in [1, 10, 100, 1000, 10000]:
+    vec_env = VecFastBallEnv(nb_envs, HORIZON)
+    obs = vec_env.reset()
+    actions = np.random.uniform(-1, 1, (nb_envs, 2))
+    start = time.time()
+    steps = max(100, 100000 // nb_envs)
+    for _ in range(steps):
+        obs, rewards, dones, infos = vec_env.step(actions, out=obs)
+    assert rewards.shape == (nb_envs,)
+    print("steps per second, fast vec", nb_envs, ":", steps * nb_envs / (time.time() - start))
@@ -0,0 +1,23 @@
+from ss.envs.ball_env import BallEnv
+from ss.envs.box_env import BoxEnv
+from ss.envs.reward_utils import check_batched_reward
+import numpy as np
+
+for env_type in [BallEnv, BoxEnv]:
+    for reward_type in ["sparse", "l2"]:
+        env = env_type(reward_type=reward_type)
+        obs = []
+        for _ in range(10):
+            o = env.reset()
+            obs.append(o)
+            for t in range(20):
+                o, r, _, _ = env.step(env.action_space.sample())
+                assert np.allclose(r, env.reward_fn(o))
+                obs.append(o)
+        obs = np.array(obs)
+        # relabeled goals make close-to-goal observations, which exercise the sparse threshold
+        her_obs = obs.copy()
+        her_obs[:, env.goal_idx] = env.obs_to_goal(obs)
+        check_batched_reward(env.reward_fn, obs)
+        check_batched_reward(env.reward_fn, her_obs)
+        print(env_type.__name__, reward_type, "ok")
@@ -0,0 +1,27 @@
+from ss.envs.ball_env import BallEnv
+from ss.envs.vec_env import VecMujocoEnv
+import numpy as np
+import time
+
+TOTAL_STEPS = 10000
+HORIZON = 50
+
+env = BallEnv()
+env.reset()
+start = time.time()
+for t in range(TOTAL_STEPS):
+    env.step(np.ones((2)))
+    if (t + 1) % HORIZON == 0:
+        env.reset()
+print("steps per second, one:", TOTAL_STEPS / (time.time() - start))
+
+for nb_envs in [1, 2, 5, 10, 20, 50]:
+    vec_env = VecMujocoEnv(BallEnv, nb_envs, HORIZON)
+    obs = vec_env.reset()
+    assert obs.shape == (nb_envs,) + vec_env.observation_space.shape
+    actions = np.ones((nb_envs, 2))
+    start = time.time()
+    for _ in range(TOTAL_STEPS // nb_envs):
+        obs, rewards, dones, infos = vec_env.step(actions)
+    assert rewards.shape == (nb_envs,)
+    print("steps per second, vec", nb_envs, ":", TOTAL_STEPS / (time.time() - start))
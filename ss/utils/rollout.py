@@ -1,7 +1,5 @@
 import numpy as np
 import pickle
-from ss.envs.ball_env import BallEnv
-from ss.envs.box_env import BoxEnv
 import click
 
 class Rollout:
@@ -42,6 +40,7 @@ class Rollout:
 def play(rollout_pickle_file):
     f = open(rollout_pickle_file, "rb")
     rollouts = pickle.load(f)
+    from ss.envs.box_env import BoxEnv # keeps importing Rollout free of mujoco_py
     env = BoxEnv()
     for r in rollouts:
         for i in range(len(r.states)):